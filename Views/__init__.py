@@ -1,5 +1,8 @@
+from .admin import *
+from .analytics import *
 from .auth import *
 from .cart import *
+from .events import *
 from .meal import *
 from .menu import *
 from .notifications import *
@@ -1,18 +1,55 @@
 from flask import jsonify, request, Blueprint
 
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from auth_context import user_required, get_current_user
 from datetime import datetime
+from models import db, Meal, Menu, Order
+import availability
+import capacity
+import earnings
+import menu_cache
+import rollups
+import search_index
+from Views.order import _page_orders
 
 admin_bp = Blueprint("admin_bp", __name__)
 
+CATERERS_ONLY = {"error": "Access denied, caterer privileges required"}
+NOT_YOUR_MEAL = {"error": "Access denied, caterers may only change their own meals"}
+
+
+def _earnings_scope(user):
+    """
+    Caterers only ever see their own meals; admins may pick one with ?caterer_id= or see everyone.
+    Returns (caterer_id or None, error response or None).
+    """
+    if user and user.role == 'caterer':
+        return user.id, None
+    if user and user.role == 'admin':
+        try:
+            caterer_id = request.args.get('caterer_id')
+            return (int(caterer_id) if caterer_id else None), None
+        except ValueError:
+            return None, (jsonify({"error": "caterer_id must be an integer"}), 400)
+    return None, (jsonify(CATERERS_ONLY), 403)
+
+
+def _date_range():
+    """Read ?from= and ?to= (YYYY-MM-DD), defaulting to today. Returns (start, end) or None."""
+    today = datetime.utcnow().date()
+    try:
+        start = datetime.strptime(request.args['from'], "%Y-%m-%d").date() if request.args.get('from') else today
+        end = datetime.strptime(request.args['to'], "%Y-%m-%d").date() if request.args.get('to') else start
+    except ValueError:
+        return None
+    if end < start:
+        return None
+    return start, end
+
 # Admin: Add a New Meal Option
 @admin_bp.route("/admin/meals", methods=["POST"])
-@jwt_required()
+@user_required('caterer', denied=CATERERS_ONLY)
 def add_meal():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'caterer':
-        return jsonify({"error": "Access denied, caterer privileges required"}), 403
+    user = get_current_user()
 
     data = request.get_json()
     name = data.get('name')
@@ -25,109 +62,172 @@ def add_meal():
     if Meal.query.filter_by(name=name).first():
         return jsonify({"error": "Meal already exists"}), 400
 
-    new_meal = Meal(name=name, price=price, image_url=image_url)
+    new_meal = Meal(name=name, price=price, image_url=image_url, caterer_id=user.id)
     db.session.add(new_meal)
     db.session.commit()
+    search_index.upsert(new_meal)
     return jsonify({"msg": f"Meal '{name}' added successfully!"}), 201
 
 # Admin: Modify a Meal Option
 @admin_bp.route("/admin/meals/<int:meal_id>", methods=["PUT"])
-@jwt_required()
+@user_required('caterer', denied=CATERERS_ONLY)
 def modify_meal(meal_id):
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'caterer':
-        return jsonify({"error": "Access denied, caterer privileges required"}), 403
-
     meal = Meal.query.get(meal_id)
     if not meal:
         return jsonify({"error": "Meal not found"}), 404
+    if meal.caterer_id != get_current_user().id:
+        return jsonify(NOT_YOUR_MEAL), 403
 
     data = request.get_json()
     meal.name = data.get('name', meal.name)
     meal.price = data.get('price', meal.price)
     meal.image_url = data.get('image_url', meal.image_url)
     db.session.commit()
+    search_index.upsert(meal)
+    menu_cache.invalidate(*menu_cache.dates_for_meal(meal.id))
     return jsonify({"msg": f"Meal '{meal.name}' updated successfully!"}), 200
 
 # Admin: Delete a Meal Option
 @admin_bp.route("/admin/meals/<int:meal_id>", methods=["DELETE"])
-@jwt_required()
+@user_required('caterer', denied=CATERERS_ONLY)
 def delete_meal(meal_id):
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'caterer':
-        return jsonify({"error": "Access denied, caterer privileges required"}), 403
-
     meal = Meal.query.get(meal_id)
     if not meal:
         return jsonify({"error": "Meal not found"}), 404
+    if meal.caterer_id != get_current_user().id:
+        return jsonify(NOT_YOUR_MEAL), 403
 
+    menu_dates = menu_cache.dates_for_meal(meal.id)
+    rollups.forget_meals([meal.id])  # Its orders go with it, so they leave the revenue rollups too
     db.session.delete(meal)
     db.session.commit()
+    menu_cache.invalidate(*menu_dates)
+    availability.discard_meal(meal_id)
+    search_index.remove(meal_id)
     return jsonify({"msg": f"Meal '{meal.name}' deleted successfully!"}), 200
 
-# Admin: Set Up a Menu for a Specific Day
+# Admin: Set Up a Menu for a New Day
 @admin_bp.route("/admin/menu", methods=["POST"])
-@jwt_required()
+@user_required('caterer', denied=CATERERS_ONLY)
 def setup_menu():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'caterer':
-        return jsonify({"error": "Access denied, caterer privileges required"}), 403
-
-    data = request.get_json()
-    date = datetime.strptime(data.get('date'), "%Y-%m-%d").date()
-    meal_ids = data.get('meal_ids', [])
-    
-    if not meal_ids:
+    """
+    Create the menu for a day that has none yet. Existing menus (and the orders and
+    capacities hanging off them) are only changed through the admin menu routes.
+    Body: date (YYYY-MM-DD), meal_ids, capacities (optional).
+    """
+    data = request.get_json() or {}
+    try:
+        date = datetime.strptime(data.get('date') or '', "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return jsonify({"error": "date is required. Use YYYY-MM-DD"}), 400
+
+    meal_ids = data.get('meal_ids')
+    if not isinstance(meal_ids, list) or not meal_ids:
         return jsonify({"error": "At least one meal must be selected"}), 400
+    if not all(isinstance(meal_id, int) and not isinstance(meal_id, bool) for meal_id in meal_ids):
+        return jsonify({"error": "meal_ids must be integers"}), 400
+
+    capacities, error = capacity.parse_capacities(data.get('capacities', {}))
+    if error:
+        return jsonify({"error": error}), 400
+
+    meals = Meal.query.filter(Meal.id.in_(meal_ids)).all()
+    if len(meals) != len(set(meal_ids)):
+        return jsonify({"error": "meal_ids may only name existing meals"}), 400
+    if set(capacities) - {meal.id for meal in meals}:
+        return jsonify({"error": "capacities may only name meals on this menu"}), 400
+
+    if Menu.query.filter_by(date=date).first():
+        return jsonify({"error": "A menu already exists for this date"}), 400
+
+    menu = Menu(date=date, meals=meals)
+    db.session.add(menu)
+    if capacities:
+        db.session.flush()
+        capacity.set_capacities(menu.id, capacities)
 
-    Menu.query.filter_by(date=date).delete()  # Remove existing menu for the day
-    
-    for meal_id in meal_ids:
-        meal = Meal.query.get(meal_id)
-        if meal:
-            new_menu_item = Menu(date=date, meal_id=meal_id)
-            db.session.add(new_menu_item)
-    
     db.session.commit()
-    return jsonify({"msg": "Menu updated successfully!"}), 201
+    menu_cache.invalidate(date)
+    availability.set_menu(menu.id, date, [meal.id for meal in meals])
+    return jsonify({"msg": "Menu created successfully!"}), 201
 
-# Admin: View All Orders
+# Admin: View All Orders, one keyset page at a time
 @admin_bp.route("/admin/orders", methods=["GET"])
-@jwt_required()
+@user_required('admin', 'caterer', denied=CATERERS_ONLY)
 def fetch_all_orders():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'caterer':
-        return jsonify({"error": "Access denied, caterer privileges required"}), 403
-
-    orders = Order.query.all()
-    order_list = []
-    for order in orders:
-        meal = Meal.query.get(order.meal_id)
-        order_list.append({
-            'order_id': order.id,
-            'user_id': order.user_id,
-            'meal': meal.name,
-            'order_date': order.order_date.strftime("%Y-%m-%d %H:%M:%S"),
-            'price': meal.price,
-            'image_url': meal.image_url
-        })
-    return jsonify(order_list), 200
-
-# Admin: View Earnings for the Day
+    """
+    Newest first, at most `limit` orders per page (same paging and filters as
+    /orders/admin-history). Query params: limit, cursor, from, to, status, user_id, caterer_id.
+    """
+    caterer_id, error = _earnings_scope(get_current_user())
+    if error:
+        return error
+
+    # One joined query instead of a Meal lookup per order
+    query = db.session.query(
+        Order.id, Order.user_id, Order.date, Order.quantity, Order.total_price,
+        Meal.name, Meal.price, Meal.image_url
+    ).join(Meal, Meal.id == Order.meal_id)
+    if caterer_id is not None:
+        query = query.filter(Meal.caterer_id == caterer_id)
+
+    orders, next_cursor, error = _page_orders(query)
+    if error:
+        return error
+
+    order_list = [{
+        'order_id': order.id,
+        'user_id': order.user_id,
+        'meal': order.name,
+        'order_date': order.date.strftime("%Y-%m-%d %H:%M:%S"),
+        'quantity': order.quantity,
+        'total_price': order.total_price,
+        'price': order.price,
+        'image_url': order.image_url
+    } for order in orders]
+    return jsonify({"orders": order_list, "next_cursor": next_cursor}), 200
+
+# Admin: View Earnings for the Day (or ?from=&to=)
 @admin_bp.route("/admin/earnings", methods=["GET"])
-@jwt_required()
+@user_required('admin', 'caterer', denied=CATERERS_ONLY)
 def view_earnings():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user or user.role != 'caterer':
-        return jsonify({"error": "Access denied, caterer privileges required"}), 403
-
-    today = datetime.utcnow().date()
-    orders_today = Order.query.filter(Order.order_date >= today).all()
-    total_earnings = sum(Meal.query.get(order.meal_id).price for order in orders_today)
-
-    return jsonify({"total_earnings": total_earnings}), 200
+    caterer_id, error = _earnings_scope(get_current_user())
+    if error:
+        return error
+
+    date_range = _date_range()
+    if not date_range:
+        return jsonify({"error": "Invalid date range. Use YYYY-MM-DD"}), 400
+    start, end = date_range
+
+    totals = earnings.total(start, end, caterer_id)
+    return jsonify({
+        "total_earnings": totals['earnings'],
+        "quantity": totals['quantity'],
+        "orders": totals['orders'],
+        "from": start.strftime("%Y-%m-%d"),
+        "to": end.strftime("%Y-%m-%d")
+    }), 200
+
+# Admin: Earnings broken down per caterer, meal or day
+@admin_bp.route("/admin/earnings/<string:breakdown>", methods=["GET"])
+@user_required('admin', 'caterer', denied=CATERERS_ONLY)
+def view_earnings_breakdown(breakdown):
+    views = {'caterers': earnings.by_caterer, 'meals': earnings.by_meal, 'days': earnings.by_day}
+    if breakdown not in views:
+        return jsonify({"error": "Breakdown must be caterers, meals or days"}), 404
+
+    caterer_id, error = _earnings_scope(get_current_user())
+    if error:
+        return error
+
+    date_range = _date_range()
+    if not date_range:
+        return jsonify({"error": "Invalid date range. Use YYYY-MM-DD"}), 400
+    start, end = date_range
+
+    return jsonify({
+        breakdown: views[breakdown](start, end, caterer_id),
+        "from": start.strftime("%Y-%m-%d"),
+        "to": end.strftime("%Y-%m-%d")
+    }), 200
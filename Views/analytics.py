@@ -0,0 +1,189 @@
+from flask import Blueprint, request, jsonify, current_app
+from auth_context import user_required
+from datetime import datetime, timedelta
+from models import db, User, Meal, MealDailyStats
+
+# Every endpoint here reads the pre-aggregated meal_daily_stats table, never orders
+analytics_bp = Blueprint('analytics_bp', __name__, url_prefix='/analytics')
+
+
+def _parse_range():
+    """
+    Read ?from= and ?to= (YYYY-MM-DD). Defaults to the last 28 days.
+    Returns (start, end, None) or (None, None, error response).
+    """
+    try:
+        end = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+            if request.args.get('to') else datetime.utcnow().date()
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+            if request.args.get('from') else end - timedelta(days=27)
+    except ValueError:
+        return None, None, (jsonify({'message': 'Invalid date format. Use YYYY-MM-DD.'}), 400)
+
+    if end < start:
+        return None, None, (jsonify({'message': 'to must not be before from'}), 400)
+
+    max_days = current_app.config.get('ANALYTICS_RANGE_MAX_DAYS', 731)
+    if (end - start).days + 1 > max_days:
+        return None, None, (jsonify({'message': f'Date range cannot exceed {max_days} days'}), 400)
+
+    return start, end, None
+
+
+def _parse_int(name):
+    value = request.args.get(name)
+    return int(value) if value not in (None, '') else None
+
+
+# Top meals by quantity or revenue
+@analytics_bp.route('/top-meals', methods=['GET'])
+@user_required('admin')
+def top_meals():
+    """Query params: from, to, by (quantity|revenue), limit, caterer_id."""
+    start, end, error = _parse_range()
+    if error:
+        return error
+
+    by = request.args.get('by', 'quantity')
+    if by not in ('quantity', 'revenue'):
+        return jsonify({'message': 'by must be quantity or revenue'}), 400
+
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+        caterer_id = _parse_int('caterer_id')
+    except ValueError:
+        return jsonify({'message': 'limit and caterer_id must be integers'}), 400
+
+    quantity = db.func.sum(MealDailyStats.quantity).label('quantity')
+    revenue = db.func.sum(MealDailyStats.revenue).label('revenue')
+    orders = db.func.sum(MealDailyStats.order_count).label('orders')
+    query = db.session.query(Meal.id, Meal.name, Meal.caterer_id, quantity, revenue, orders)\
+        .join(Meal, Meal.id == MealDailyStats.meal_id)\
+        .filter(MealDailyStats.day >= start, MealDailyStats.day <= end)
+    if caterer_id is not None:
+        query = query.filter(Meal.caterer_id == caterer_id)
+
+    rows = query.group_by(Meal.id, Meal.name, Meal.caterer_id)\
+        .order_by((quantity if by == 'quantity' else revenue).desc(), Meal.id)\
+        .limit(limit).all()
+
+    return jsonify({
+        'from': start.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d'),
+        'by': by,
+        'meals': [{
+            'meal_id': row.id,
+            'name': row.name,
+            'caterer_id': row.caterer_id,
+            'quantity': row.quantity,
+            'revenue': row.revenue,
+            'orders': row.orders
+        } for row in rows]
+    }), 200
+
+
+# Per-caterer sales breakdown
+@analytics_bp.route('/caterers', methods=['GET'])
+@user_required('admin')
+def caterer_breakdown():
+    """Query params: from, to."""
+    start, end, error = _parse_range()
+    if error:
+        return error
+
+    revenue = db.func.sum(MealDailyStats.revenue).label('revenue')
+    rows = db.session.query(
+        User.id, User.username,
+        db.func.sum(MealDailyStats.quantity).label('quantity'),
+        revenue,
+        db.func.sum(MealDailyStats.order_count).label('orders'),
+        db.func.count(db.distinct(MealDailyStats.meal_id)).label('meals_sold')
+    ).join(Meal, Meal.id == MealDailyStats.meal_id)\
+        .join(User, User.id == Meal.caterer_id)\
+        .filter(MealDailyStats.day >= start, MealDailyStats.day <= end)\
+        .group_by(User.id, User.username)\
+        .order_by(revenue.desc(), User.id).all()
+
+    return jsonify({
+        'from': start.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d'),
+        'caterers': [{
+            'caterer_id': row.id,
+            'caterer': row.username,
+            'quantity': row.quantity,
+            'revenue': row.revenue,
+            'orders': row.orders,
+            'meals_sold': row.meals_sold
+        } for row in rows]
+    }), 200
+
+
+# Daily or weekly sales series with period-over-period change
+@analytics_bp.route('/series', methods=['GET'])
+@user_required('admin')
+def sales_series():
+    """Query params: from, to, interval (day|week), meal_id, caterer_id."""
+    start, end, error = _parse_range()
+    if error:
+        return error
+
+    interval = request.args.get('interval', 'week')
+    if interval not in ('day', 'week'):
+        return jsonify({'message': 'interval must be day or week'}), 400
+
+    try:
+        meal_id = _parse_int('meal_id')
+        caterer_id = _parse_int('caterer_id')
+    except ValueError:
+        return jsonify({'message': 'meal_id and caterer_id must be integers'}), 400
+
+    # The database sums per day; at most one row per day comes back
+    query = db.session.query(
+        MealDailyStats.day,
+        db.func.sum(MealDailyStats.quantity).label('quantity'),
+        db.func.sum(MealDailyStats.revenue).label('revenue'),
+        db.func.sum(MealDailyStats.order_count).label('orders')
+    ).filter(MealDailyStats.day >= start, MealDailyStats.day <= end)
+    if meal_id is not None:
+        query = query.filter(MealDailyStats.meal_id == meal_id)
+    if caterer_id is not None:
+        query = query.join(Meal, Meal.id == MealDailyStats.meal_id).filter(Meal.caterer_id == caterer_id)
+    daily = query.group_by(MealDailyStats.day).all()
+
+    # Bucket into periods (weeks start on Monday) in a single pass
+    buckets = {}
+    for row in daily:
+        period = row.day - timedelta(days=row.day.weekday()) if interval == 'week' else row.day
+        bucket = buckets.setdefault(period, {'quantity': 0, 'revenue': 0.0, 'orders': 0})
+        bucket['quantity'] += row.quantity or 0
+        bucket['revenue'] += row.revenue or 0
+        bucket['orders'] += row.orders or 0
+
+    step = timedelta(days=7 if interval == 'week' else 1)
+    period = start - timedelta(days=start.weekday()) if interval == 'week' else start
+    series = []
+    previous = None
+    while period <= end:
+        bucket = buckets.get(period, {'quantity': 0, 'revenue': 0.0, 'orders': 0})
+        series.append({
+            'period_start': period.strftime('%Y-%m-%d'),
+            **bucket,
+            'quantity_change': _change(bucket['quantity'], previous['quantity']) if previous else None,
+            'revenue_change': _change(bucket['revenue'], previous['revenue']) if previous else None
+        })
+        previous = bucket
+        period += step
+
+    return jsonify({
+        'from': start.strftime('%Y-%m-%d'),
+        'to': end.strftime('%Y-%m-%d'),
+        'interval': interval,
+        'series': series
+    }), 200
+
+
+def _change(current, previous):
+    """Relative change from the previous period, or None when there was nothing before."""
+    if not previous:
+        return None
+    return round((current - previous) / previous, 4)
@@ -3,9 +3,9 @@ from flask_jwt_extended import create_access_token, create_refresh_token, jwt_re
 from flask_dance.contrib.google import make_google_blueprint, google
 from flask_dance.contrib.github import make_github_blueprint, github
 from flask_dance.contrib.facebook import make_facebook_blueprint, facebook
-from datetime import datetime, timezone
+from datetime import datetime
 from werkzeug.security import generate_password_hash
-from jwt.exceptions import ExpiredSignatureError
+from auth_context import user_required, get_current_user, token_claims
 
 # Blueprint for auth routes
 auth_bp = Blueprint("auth_bp", __name__)
@@ -24,8 +24,9 @@ def login():
     user = User.query.filter_by(email=email).first()
 
     if user and user.check_password(password):  # Assuming check_password exists in User model
-        access_token = create_access_token(identity=user.email)  # Use email as identity
-        refresh_token = create_refresh_token(identity=user.email)  # Generate refresh token
+        claims = token_claims(user)  # uid and role: authorization reads them instead of the users table
+        access_token = create_access_token(identity=user.email, additional_claims=claims)  # Use email as identity
+        refresh_token = create_refresh_token(identity=user.email, additional_claims=claims)  # Generate refresh token
         return jsonify(access_token=access_token, refresh_token=refresh_token), 200
     else:
         return jsonify({"error": "Invalid email or password"}), 401
@@ -33,36 +34,33 @@ def login():
 
 # Get current user information with token expiration handling
 @auth_bp.route("/current_user", methods=["GET"])
-@jwt_required()
+@user_required()
 def current_user():
     from models import User  # Import here to avoid circular imports
-    try:
-        email = get_jwt_identity()  # Get the email from the JWT
-        user = User.query.filter_by(email=email).first()
-
-        if user:
-            return jsonify({
-                "id": user.id,
-                "email": user.email,
-                "username": user.username,
-                "role": user.role
-            }), 200
-        else:
-            return jsonify({"message": "User not found"}), 404
-    except ExpiredSignatureError:
-        return jsonify({"error": "Token has expired"}), 401
-    except Exception as e:
-        print("Error in /current_user:", str(e))  # Log the error
-        return jsonify({"error": "Unauthorized"}), 401
+    user = User.query.get(get_current_user().id)
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+
+    return jsonify({
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "role": user.role
+    }), 200
 
 
 # Token Refresh Endpoint
 @auth_bp.route("/refresh", methods=["POST"])
 @jwt_required(refresh=True)
 def refresh():
+    from models import User  # Import here to avoid circular imports
     try:
         identity = get_jwt_identity()
-        new_access_token = create_access_token(identity=identity)
+        # Re-read the claims: a deleted user gets no new token, and older tokens gain claims
+        user = User.query.filter_by(email=identity).first()
+        if not user:
+            return jsonify({"error": "Could not refresh token"}), 401
+        new_access_token = create_access_token(identity=identity, additional_claims=token_claims(user))
         return jsonify(access_token=new_access_token), 200
     except Exception as e:
         return jsonify({"error": "Could not refresh token"}), 401
@@ -73,13 +71,15 @@ def refresh():
 @jwt_required()
 def logout():
     from models import db, TokenBlocklist  # Ensure db is imported
+    import revocation
 
     jti = get_jwt()["jti"]
-    now = datetime.now(timezone.utc)
+    now = datetime.utcnow()  # Naive UTC, like every other timestamp column
 
-    # Add the token to the blocklist
+    # Add the token to the blocklist; other workers pick it up on their next refresh
     db.session.add(TokenBlocklist(jti=jti, created_at=now))
     db.session.commit()
+    revocation.revoke(jti, now)
 
     return jsonify({"success": "Logged out successfully"}), 200
 @auth_bp.route("/login_with_google", methods=["POST"])
@@ -95,8 +95,9 @@ def login_with_google():
     user = User.query.filter_by(email=email).first()
 
     if user:
-        access_token = create_access_token(identity=user.email)  # Use email as identity
-        refresh_token = create_refresh_token(identity=user.email)  # Generate refresh token
+        claims = token_claims(user)
+        access_token = create_access_token(identity=user.email, additional_claims=claims)  # Use email as identity
+        refresh_token = create_refresh_token(identity=user.email, additional_claims=claims)  # Generate refresh token
         return jsonify(access_token=access_token, refresh_token=refresh_token), 200
 
 
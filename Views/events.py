@@ -0,0 +1,45 @@
+import json
+from flask import Blueprint, Response, current_app
+from auth_context import user_required, get_current_user
+import events
+
+events_bp = Blueprint('events_bp', __name__)
+
+
+# Live updates over Server-Sent Events instead of polling
+@events_bp.route('/events', methods=['GET'])
+@user_required(locations=['headers', 'query_string'])  # EventSource cannot set headers: use ?jwt=<token>
+def stream_events():
+    """
+    Everyone receives their own notifications and order updates plus broadcasts to their role;
+    admins and caterers also receive the kitchen feed of new orders and status changes.
+    An idle client is a parked queue and a heartbeat comment every EVENTS_HEARTBEAT_SECONDS.
+    """
+    user = get_current_user()
+
+    channels = [events.user_channel(user.id), events.role_channel(user.role)]
+    if user.role in ('admin', 'caterer'):
+        channels.append(events.KITCHEN)
+
+    heartbeat = current_app.config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+    subscription = events.subscribe(channels)
+
+    # Not wrapped in stream_with_context: the request (and its database session)
+    # ends here, so an open stream holds no connection from the pool
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            while not subscription.overflowed:
+                message = subscription.get(heartbeat)
+                if message is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                event, data = message
+                yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+        finally:
+            events.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
@@ -1,20 +1,28 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from auth_context import user_required, get_current_user
 from models import Meal, User, db
+from sqlalchemy import insert
+import csv
+import io
+import json
+import math
 import os
 from werkzeug.utils import secure_filename
+import menu_cache
+import rollups
+import availability
+import search_index
+from pagination import parse_limit, parse_int_arg, parse_float_arg
 
 meal_bp = Blueprint("meal", __name__, url_prefix="/meal")
 
+NOT_ADMIN = {"message": "Unauthorized - Not an Admin"}
+
 # Add a new meal (Admin only)
 @meal_bp.route("/add", methods=["POST"])
-@jwt_required()
+@user_required('admin', denied=NOT_ADMIN)
 def add_meal():
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-    
-    if not user or user.role != "admin":  # Check role instead of is_admin
-        return jsonify({"message": "Unauthorized - Not an Admin"}), 403
+    user = get_current_user()
 
     data = request.get_json()
     print("data is ",data)
@@ -27,20 +35,180 @@ def add_meal():
 
     db.session.add(new_meal)
     db.session.commit()
+    search_index.upsert(new_meal)
 
     return jsonify({"message": "Meal added successfully!"}), 201
 
 
+# Bulk import meals (Admin only)
+@meal_bp.route("/import", methods=["POST"])
+@user_required('admin', denied=NOT_ADMIN)
+def import_meals():
+    """
+    Stream a CSV (text/csv) or NDJSON (application/x-ndjson) body of meals.
+    Columns/keys: name, price, image_url (optional), caterer_id (optional, defaults to the admin).
+    Valid rows are inserted in batches, one transaction per batch.
+    """
+    user = get_current_user()
+
+    mimetype = request.mimetype
+    if mimetype in ("text/csv", "application/csv"):
+        fmt = "csv"
+    elif mimetype in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        fmt = "ndjson"
+    else:
+        return jsonify({"error": "Content-Type must be text/csv or application/x-ndjson"}), 415
+
+    batch_size = current_app.config.get("MEAL_IMPORT_BATCH_SIZE", 5000)
+    max_errors = current_app.config.get("MEAL_IMPORT_MAX_ERRORS", 1000)
+
+    # Read straight from the WSGI input so the upload is never buffered whole
+    text = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+
+    imported = 0
+    failed = 0
+    errors = []
+    batch = []
+
+    def record_error(row_number, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append({"row": row_number, "error": message})
+
+    def flush():
+        nonlocal imported
+        if not batch:
+            return
+        rows = _check_caterers(batch, user.id, record_error)
+        if rows:
+            try:
+                db.session.execute(insert(Meal), [meal for _, meal in rows])
+                db.session.commit()
+                imported += len(rows)
+            except Exception as e:
+                db.session.rollback()
+                for row_number, _ in rows:
+                    record_error(row_number, f"Database error: {e.__class__.__name__}")
+        batch.clear()
+
+    try:
+        for row_number, raw in _iter_import_rows(fmt, text):
+            meal, error = _validate_import_row(raw)
+            if error:
+                record_error(row_number, error)
+                continue
+            batch.append((row_number, meal))
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({
+            "error": f"Could not read upload: {e}",
+            "imported": imported,
+            "failed": failed,
+            "errors": errors
+        }), 400
+
+    if imported:
+        search_index.invalidate()
+
+    return jsonify({
+        "message": "Import finished",
+        "imported": imported,
+        "failed": failed,
+        "errors": errors
+    }), 201 if imported else 400
+
+
+def _iter_import_rows(fmt, text):
+    """Yield (row_number, dict or None) for each data row of the upload."""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Header is line 1, so data rows start at 2
+            yield reader.line_num, row
+        return
+
+    for row_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row_number, row if isinstance(row, dict) else None
+
+
+def _validate_import_row(raw):
+    """Return (values, None) for a valid row, or (None, error message)."""
+    if raw is None:
+        return None, "Row is not a JSON object"
+
+    name = raw.get("name")
+    if name is not None and not isinstance(name, str):
+        return None, "name must be a string"
+    name = (name or "").strip()
+    if not name:
+        return None, "name is required"
+    if len(name) > 100:
+        return None, "name must be at most 100 characters"
+
+    price = raw.get("price")
+    if isinstance(price, bool):
+        return None, "price must be a number"
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None, "price must be a number"
+    if not math.isfinite(price):
+        return None, "price must be a finite number"
+    if price < 0:
+        return None, "price must not be negative"
+
+    image_url = raw.get("image_url")
+    if image_url is not None and not isinstance(image_url, str):
+        return None, "image_url must be a string"
+    image_url = (image_url or "").strip() or "default_meal_img.png"
+    if len(image_url) > 255:
+        return None, "image_url must be at most 255 characters"
+
+    caterer_id = raw.get("caterer_id")
+    if caterer_id not in (None, ""):
+        try:
+            caterer_id = int(caterer_id)
+        except (TypeError, ValueError):
+            return None, "caterer_id must be an integer"
+    else:
+        caterer_id = None
+
+    return {"name": name, "price": price, "image_url": image_url, "caterer_id": caterer_id}, None
+
+
+def _check_caterers(batch, default_caterer_id, record_error):
+    """Fill in default caterers and drop rows pointing at unknown users (one query per batch)."""
+    requested = {meal["caterer_id"] for _, meal in batch if meal["caterer_id"] is not None}
+    known = set()
+    if requested:
+        known = {row.id for row in db.session.query(User.id).filter(User.id.in_(requested))}
+
+    rows = []
+    for row_number, meal in batch:
+        if meal["caterer_id"] is None:
+            meal["caterer_id"] = default_caterer_id
+        elif meal["caterer_id"] not in known:
+            record_error(row_number, f"Caterer with id {meal['caterer_id']} not found")
+            continue
+        rows.append((row_number, meal))
+    return rows
+
+
 # Update meal (Admin only)
 @meal_bp.route("/update/<int:meal_id>", methods=["PUT"])
-@jwt_required()
+@user_required('admin', denied=NOT_ADMIN)
 def update_meal(meal_id):
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-    
-    if not user or user.role != "admin":  # Check role instead of is_admin
-        return jsonify({"message": "Unauthorized - Not an Admin"}), 403
-
     data = request.get_json()
     meal = Meal.query.get_or_404(meal_id)
 
@@ -49,36 +217,89 @@ def update_meal(meal_id):
     meal.image_url = data.get("image_url", meal.image_url)
 
     db.session.commit()
+    search_index.upsert(meal)
+    menu_cache.invalidate(*menu_cache.dates_for_meal(meal.id))
     return jsonify({"message": "Meal updated successfully!"}), 200
 
 
 # Delete meal (Admin only)
 @meal_bp.route("/delete/<int:meal_id>", methods=["DELETE"])
-@jwt_required()
+@user_required('admin', denied=NOT_ADMIN)
 def delete_meal(meal_id):
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-    
-    if not user or user.role != "admin":  # Check role instead of is_admin
-        return jsonify({"message": "Unauthorized - Not an Admin"}), 403
-
     meal = Meal.query.get(meal_id)
     if meal is None:
         return jsonify({"error": "Meal not found"}), 404
 
+    # Capture affected menu dates before the cascade removes the links
+    menu_dates = menu_cache.dates_for_meal(meal.id)
+    rollups.forget_meals([meal.id])  # Its orders go with it, so they leave the revenue rollups too
     db.session.delete(meal)
     db.session.commit()
+    menu_cache.invalidate(*menu_dates)
+    availability.discard_meal(meal_id)
+    search_index.remove(meal_id)
     return jsonify({"message": "Meal deleted successfully!"}), 200
 
 
 # Get all meals (Anyone can access)
 @meal_bp.route("/all", methods=["GET"])
 def get_meals():
-    meals = Meal.query.all()
-    if not meals:
-        return jsonify({"message": "No meals available"}), 404
+    """
+    Page through the catalog by meal id.
+    Query params: limit, after (last id seen), caterer_id, min_price, max_price.
+    """
+    limit = parse_limit()
+    if limit is None:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    try:
+        after = parse_int_arg("after")
+        caterer_id = parse_int_arg("caterer_id")
+        min_price = parse_float_arg("min_price")
+        max_price = parse_float_arg("max_price")
+    except ValueError:
+        return jsonify({"error": "after, caterer_id, min_price and max_price must be numeric"}), 400
+
+    # Column-only projection: no ORM identity map, no relationship loading
+    query = db.session.query(Meal.id, Meal.name, Meal.price, Meal.image_url)
+    if after is not None:
+        query = query.filter(Meal.id > after)
+    if caterer_id is not None:
+        query = query.filter(Meal.caterer_id == caterer_id)
+    if min_price is not None:
+        query = query.filter(Meal.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Meal.price <= max_price)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(Meal.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
     meal_list = [
-        {"id": m.id, "name": m.name, "price": m.price, "image_url": m.image_url} for m in meals
+        {"id": m.id, "name": m.name, "price": m.price, "image_url": m.image_url} for m in rows
     ]
-    return jsonify({"meals": meal_list}), 200
+    return jsonify({
+        "meals": meal_list,
+        "next_cursor": rows[-1].id if has_more else None
+    }), 200
+
+
+# Search meals by name (Anyone can access)
+@meal_bp.route("/search", methods=["GET"])
+def search_meals():
+    """
+    Prefix and fuzzy (trigram) search on meal names.
+    Query params: q, limit.
+    """
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    if len(query) > 100:
+        return jsonify({"error": "q must be at most 100 characters"}), 400
+
+    limit = parse_limit(default=10, maximum=50)
+    if limit is None:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    return jsonify({"meals": search_index.search(query, limit)}), 200
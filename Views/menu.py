@@ -1,7 +1,11 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, make_response, current_app
+from flask_jwt_extended import jwt_required
+from auth_context import user_required, get_current_user
 from datetime import date, datetime
-from models import db, Menu, Meal, User
+from models import db, Menu, Meal, menu_meals
+import menu_cache
+import availability
+import capacity
 
 menu_bp = Blueprint('menu', __name__)
 
@@ -14,17 +18,11 @@ def validate_date(date_str):
 
 # Admin: Set up a menu for a specific day
 @menu_bp.route('/menu', methods=['POST'])
-@jwt_required()
+@user_required('admin', denied={'error': 'Access denied. Only admins can create menus'})
 def create_menu():
     """
     Admin sets up a menu by selecting meals for a specific date.
     """
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).one_or_none()
-
-    if not user or user.role != 'admin':
-        return jsonify({'error': 'Access denied. Only admins can create menus'}), 403
-
     data = request.get_json()
     menu_date = validate_date(data.get('date', str(date.today())))
 
@@ -44,17 +42,33 @@ def create_menu():
     if missing_meals:
         return jsonify({'error': f'Meal(s) with ID(s) {list(missing_meals)} not found'}), 404
 
+    # Optional portions per meal: {meal_id: portions}
+    capacities, error = capacity.parse_capacities(data.get('capacities', {}))
+    if error:
+        return jsonify({'error': error}), 400
+    if set(capacities) - set(meal_ids):
+        return jsonify({'error': 'capacities may only name meals on this menu'}), 400
+
     new_menu = Menu(date=menu_date)
     new_menu.meals.extend(meals)
     db.session.add(new_menu)
+    if capacities:
+        db.session.flush()
+        capacity.set_capacities(new_menu.id, capacities)
     db.session.commit()
+    menu_cache.invalidate(menu_date)
+    availability.set_menu(new_menu.id, menu_date, [meal.id for meal in meals])
 
     return jsonify({'message': 'Menu created successfully'}), 201
 
-# Get menu for a specific day
-@menu_bp.route('/menu/<string:menu_date>', methods=['GET'])
-@jwt_required()
-def get_menu(menu_date):
+# Set how many portions of each meal can be sold on a day
+@menu_bp.route('/menu/<string:menu_date>/capacity', methods=['PUT'])
+@user_required('admin', 'caterer', denied={'error': 'Access denied. Only admins and caterers can set capacity'})
+def set_menu_capacity(menu_date):
+    """
+    Body: {"capacities": {meal_id: portions}}; null portions removes the limit.
+    Portions already ordered stay taken.
+    """
     menu_date_obj = validate_date(menu_date)
     if not menu_date_obj:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
@@ -63,37 +77,158 @@ def get_menu(menu_date):
     if not menu:
         return jsonify({'error': 'No menu found for this date'}), 404
 
+    capacities, error = capacity.parse_capacities((request.get_json() or {}).get('capacities'))
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Caterers only ration their own meals
+    user = get_current_user()
+    if user.role == 'caterer' and capacities:
+        others = [meal_id for meal_id, in db.session.query(Meal.id).filter(
+            Meal.id.in_(list(capacities)), Meal.caterer_id != user.id
+        )]
+        if others:
+            return jsonify({'error': f'Caterers may only set capacity for their own meals, not {sorted(others)}'}), 403
+
+    missing = capacity.set_capacities(menu.id, capacities)
+    if missing:
+        db.session.rollback()
+        return jsonify({'error': f'Meal(s) with ID(s) {missing} are not on this menu'}), 404
+    db.session.commit()
+    menu_cache.invalidate(menu_date_obj)
+
+    limits = capacity.for_menus([menu.id]).get(menu.id, {})
+    return jsonify({
+        'message': 'Capacity updated',
+        'meals': [{'id': meal_id, 'capacity': portions, 'remaining': remaining}
+                  for meal_id, (portions, remaining) in sorted(limits.items())]
+    }), 200
+
+def serialize_menu(menu, meals):
+    """Build the JSON payload for a menu and its meals, given as (meal, capacity, remaining) rows."""
     # Convert menu.date to a datetime.date object if it's a string
     if isinstance(menu.date, str):
         menu_date_obj = datetime.strptime(menu.date, '%Y-%m-%d').date()
     else:
         menu_date_obj = menu.date
 
-    return jsonify({
+    return {
         'date': menu_date_obj.strftime('%Y-%m-%d'),
-        'meals': [{'id': meal.id, 'name': meal.name, 'price': meal.price, 'image':meal.image_url} for meal in menu.meals],
+        'meals': [{
+            'id': meal.id,
+            'name': meal.name,
+            'price': meal.price,
+            'image': meal.image_url,
+            'capacity': portions,  # None means unlimited
+            'remaining': remaining
+        } for meal, portions, remaining in meals],
         'menu_id':menu.id
-    }), 200
+    }
+
+def _menu_meals(menu_ids):
+    """{menu_id: [(meal, capacity, remaining)]} for the given menus, in one query."""
+    rows = db.session.query(menu_meals.c.menu_id, Meal, menu_meals.c.capacity, menu_meals.c.remaining)\
+        .join(Meal, Meal.id == menu_meals.c.meal_id)\
+        .filter(menu_meals.c.menu_id.in_(list(menu_ids)))\
+        .order_by(menu_meals.c.menu_id, Meal.id).all()
+    meals = {}
+    for menu_id, meal, portions, remaining in rows:
+        meals.setdefault(menu_id, []).append((meal, portions, remaining))
+    return meals
+
+def _with_remaining(payload):
+    """Cached menus keep their shape; portions left change with every order, so re-read them."""
+    if all(meal.get('capacity') is None for meal in payload['meals']):
+        return payload
+
+    limits = capacity.for_menus([payload['menu_id']]).get(payload['menu_id'], {})
+    meals = []
+    for meal in payload['meals']:
+        portions, remaining = limits.get(meal['id'], (None, None))
+        meals.append({**meal, 'capacity': portions, 'remaining': remaining})
+    return {**payload, 'meals': meals}
+
+# Get menu for a specific day
+@menu_bp.route('/menu/<string:menu_date>', methods=['GET'])
+@jwt_required()
+def get_menu(menu_date):
+    menu_date_obj = validate_date(menu_date)
+    if not menu_date_obj:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+    # Serve repeat polls from the cache; a matching ETag needs no body at all
+    cache_key = str(menu_date_obj)
+    cached = menu_cache.get(cache_key)
+    if cached:
+        payload, etag = cached
+        limited = _with_remaining(payload)
+        if limited is not payload:
+            payload, etag = limited, menu_cache.make_etag(limited)
+    else:
+        menu = Menu.query.filter_by(date=menu_date_obj).first()
+        if not menu:
+            return jsonify({'error': 'No menu found for this date'}), 404
+
+        payload = serialize_menu(menu, _menu_meals([menu.id]).get(menu.id, []))
+        etag = menu_cache.put(cache_key, payload)
+
+    if request.if_none_match.contains(etag):
+        return _menu_response(None, etag, 304)
+    return _menu_response(payload, etag, 200)
+
+def _menu_response(payload, etag, status):
+    """Attach the strong ETag so clients can revalidate with If-None-Match."""
+    response = jsonify(payload) if payload is not None else make_response('', status)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Get every menu in a date range (e.g. a weekly planner)
+@menu_bp.route('/menus', methods=['GET'])
+@jwt_required()
+def get_menus():
+    """
+    Menus between ?from= and ?to= (inclusive, YYYY-MM-DD).
+    Runs two queries regardless of range length: menus, then their meals and portions.
+    """
+    start = validate_date(request.args.get('from', ''))
+    end = validate_date(request.args.get('to', ''))
+    if not start or not end:
+        return jsonify({'error': 'from and to are required. Use YYYY-MM-DD'}), 400
+    if end < start:
+        return jsonify({'error': 'to must not be before from'}), 400
+
+    max_days = current_app.config.get('MENU_RANGE_MAX_DAYS', 62)
+    if (end - start).days + 1 > max_days:
+        return jsonify({'error': f'Date range cannot exceed {max_days} days'}), 400
+
+    menus = Menu.query.filter(Menu.date >= start, Menu.date <= end)\
+        .order_by(Menu.date).all()
+    meals = _menu_meals(menu.id for menu in menus) if menus else {}
+
+    payloads = []
+    for menu in menus:
+        payload = serialize_menu(menu, meals.get(menu.id, []))
+        menu_cache.put(payload['date'], payload)
+        payloads.append(payload)
+
+    return jsonify({'menus': payloads}), 200
 
 # Customers select a meal from the menu
 @menu_bp.route('/menu/select', methods=['POST'])
-@jwt_required()
+@user_required()
 def select_meal():
     """
     Customers can select a meal from the available menu.
     """
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).one_or_none()
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-
     data = request.get_json()
     menu_date = validate_date(data.get('date', str(date.today())))
     if not menu_date:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
-    menu = Menu.query.filter_by(date=menu_date).first()
-    if not menu:
+    available = availability.for_date(menu_date)
+    if not available:
         return jsonify({'error': 'No menu available for this date'}), 404
 
     try:
@@ -101,8 +236,11 @@ def select_meal():
     except (ValueError, TypeError):
         return jsonify({'error': 'Meal ID must be an integer'}), 400
 
+    if meal_id not in available.meal_ids:
+        return jsonify({'error': 'Selected meal is not on the menu for this date'}), 404
+
     meal = Meal.query.get(meal_id)
-    if not meal or meal not in menu.meals:
+    if not meal:
         return jsonify({'error': 'Selected meal is not on the menu for this date'}), 404
 
     return jsonify({'message': f'You have selected {meal.name} from the menu'}), 200
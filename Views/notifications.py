@@ -1,60 +1,161 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Notification
-from datetime import datetime
+from auth_context import user_required, get_current_user
+from sqlalchemy import case, false, tuple_, update
+from models import db, User, Notification, Broadcast
+from pagination import parse_limit, encode_cursor, decode_cursor
+import events
 
 notifications_bp = Blueprint('notifications', __name__)
 
-def send_notification_to_all(message):
-    """Send a notification to all customers when the daily menu is set."""
-    users = User.query.filter_by(role='customer').all()
-    
-    if not users:
-        print("No customers found to send notifications.")
-        return
-    
-    notifications = []
-    for user in users:
-        notification = Notification(user_id=user.id, message=message)
-        notifications.append(notification)
-        print(f"Sending notification to user {user.id}: {message}")  # Debugging
-
-    db.session.bulk_save_objects(notifications)
+def send_notification_to_all(message, audience='customer'):
+    """
+    Notify everyone with a role. Fan-out on read: one broadcasts row, however
+    many users there are; each user reads it through their last-seen cursor.
+    """
+    broadcast = Broadcast(message=message, audience=audience)
+    db.session.add(broadcast)
     db.session.commit()
-    
-    print("Notifications committed to DB:", notifications)
+
+    events.publish(events.role_channel(audience), 'notification', {
+        'id': broadcast.id,
+        'type': 'broadcast',
+        'message': message,
+        'timestamp': broadcast.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    })
+    return broadcast
 
 @notifications_bp.route('/set_daily_menu', methods=['POST'])
-@jwt_required()
+@user_required('admin')
 def set_daily_menu():
     """Set daily menu and notify customers."""
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-
-    # Check if the user is an admin
-    if not user or user.role != "admin":
-        return jsonify({"message": "Unauthorized. Admins only."}), 403
-
     # Send notifications to all customers
     message = "Today's menu has been set! Check it out now."
-    send_notification_to_all(message)
+    broadcast = send_notification_to_all(message)
 
-    return jsonify({"message": "Daily menu set, notifications sent."}), 201
+    return jsonify({"message": "Daily menu set, notifications sent.", "broadcast_id": broadcast.id}), 201
+
+def _unseen_broadcasts(user):
+    # The cursor moves on every read, so it is read in the same query, never from the cached user
+    last_seen = db.session.query(User.last_seen_broadcast_id).filter(User.id == user.id).scalar_subquery()
+    return Broadcast.query.filter(
+        Broadcast.audience == user.role,
+        Broadcast.id > last_seen
+    )
 
 @notifications_bp.route('/notifications', methods=['GET'])
-@jwt_required()
+@user_required()
 def get_notifications():
-    """Retrieve all notifications for the logged-in user."""
-    user_id = get_jwt_identity()
-    print(f"DEBUG: JWT Identity Retrieved: {user_id}")  # Debugging line
+    """
+    One page of the logged-in user's notifications, newest first: personal ones merged
+    with the broadcasts to their role that are newer than their last-seen cursor.
+    Query params: limit, cursor (next_cursor from the previous page), unread=1.
+    """
+    user = get_current_user()
+
+    limit = parse_limit(default=20, maximum=100)
+    if limit is None:
+        return jsonify({"message": "limit must be an integer"}), 400
+
+    personal = Notification.query.filter(Notification.user_id == user.id)
+    if request.args.get('unread') in ('1', 'true'):
+        personal = personal.filter(Notification.is_read == false())
+    broadcasts = _unseen_broadcasts(user)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"message": "Invalid cursor. Use next_cursor from a previous page."}), 400
+        personal = personal.filter(tuple_(Notification.timestamp, Notification.id) < tuple_(*after))
+        broadcasts = broadcasts.filter(tuple_(Broadcast.created_at, Broadcast.id) < tuple_(*after))
+
+    # Each source gives at most one page; the merge keeps the best `limit` of both
+    personal = personal.order_by(Notification.timestamp.desc(), Notification.id.desc()).limit(limit + 1).all()
+    broadcasts = broadcasts.order_by(Broadcast.created_at.desc(), Broadcast.id.desc()).limit(limit + 1).all()
+
+    notifications = [
+        (n.timestamp, n.id, {"id": n.id, "type": "personal", "message": n.message, "is_read": bool(n.is_read)})
+        for n in personal
+    ] + [
+        (b.created_at, b.id, {"id": b.id, "type": "broadcast", "message": b.message, "is_read": False})
+        for b in broadcasts
+    ]
+    notifications.sort(key=lambda n: (n[0], n[1]), reverse=True)
+
+    page = notifications[:limit]
+    next_cursor = encode_cursor(page[-1][0], page[-1][1]) if len(notifications) > limit else None
 
-    # Fetch notifications for the current user
-    notifications = Notification.query.filter_by(user_id=user_id).order_by(Notification.timestamp.desc()).all()
-    print(f"DEBUG: Notifications Retrieved: {notifications}")  # Debugging line
+    return jsonify({
+        "notifications": [
+            {**payload, "timestamp": sent_at.strftime('%Y-%m-%d %H:%M:%S')} for sent_at, _, payload in page
+        ],
+        "next_cursor": next_cursor
+    }), 200
 
-    if not notifications:
-        return jsonify({"message": "No notifications found"}), 404
+@notifications_bp.route('/notifications/unread-count', methods=['GET'])
+@user_required()
+def get_unread_count():
+    """Badge count: the stored personal counter plus unseen broadcasts (never more than retention keeps)."""
+    user = get_current_user()
+    unseen = _unseen_broadcasts(user).with_entities(db.func.count()).scalar_subquery()
+    unread = db.session.query(User.unread_notifications + unseen).filter(User.id == user.id).scalar()
+
+    return jsonify({"unread": unread or 0}), 200
+
+@notifications_bp.route('/notifications/read', methods=['POST'])
+@user_required()
+def mark_notifications_read():
+    """
+    Body: {"ids": [...]} marks those personal notifications read; {"all": true} marks
+    every notification read and moves the broadcast cursor to the latest broadcast.
+    One UPDATE on notifications, one on the user's counters.
+    """
+    user = get_current_user()
+
+    data = request.get_json() or {}
+    mark_all = data.get('all') is True
+    ids = data.get('ids')
+    if not mark_all:
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"message": "Send ids (a non-empty array) or all: true"}), 400
+        try:
+            ids = [int(notification_id) for notification_id in ids]
+        except (TypeError, ValueError):
+            return jsonify({"message": "ids must be integers"}), 400
+
+    query = update(Notification.__table__)\
+        .where(Notification.user_id == user.id, Notification.is_read == false())\
+        .values(is_read=True)
+    if not mark_all:
+        query = query.where(Notification.id.in_(ids))
+    marked = db.session.execute(query).rowcount
+
+    counters = {'unread_notifications': case(
+        (User.unread_notifications > marked, User.unread_notifications - marked), else_=0
+    )}
+    if mark_all:
+        counters['last_seen_broadcast_id'] = _latest_broadcast_for(User.last_seen_broadcast_id)
+    if marked or mark_all:
+        db.session.execute(update(User.__table__).where(User.id == user.id).values(**counters))
+    db.session.commit()
+
+    return jsonify({"message": "Notifications marked as read", "marked": marked}), 200
+
+def _latest_broadcast_for(current):
+    """Cursor value past every broadcast to the user's role; never moves backwards."""
+    latest = db.session.query(db.func.coalesce(db.func.max(Broadcast.id), 0))\
+        .filter(Broadcast.audience == User.role).scalar_subquery()
+    return case((latest > current, latest), else_=current)
+
+@notifications_bp.route('/notifications/broadcasts/seen', methods=['POST'])
+@user_required()
+def mark_broadcasts_seen():
+    """Move the user's cursor past every broadcast sent so far (one UPDATE)."""
+    db.session.execute(
+        update(User.__table__).where(User.id == get_current_user().id)
+        .values(last_seen_broadcast_id=_latest_broadcast_for(User.last_seen_broadcast_id))
+    )
+    db.session.commit()
 
-    return jsonify([
-        {"id": n.id, "message": n.message, "timestamp": n.timestamp.strftime('%Y-%m-%d %H:%M:%S')} for n in notifications
-    ]), 200
\ No newline at end of file
+    return jsonify({"message": "Broadcasts marked as seen"}), 200
@@ -1,11 +1,17 @@
+import csv
+import io
+import json
 import logging
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
-from models import db, Order, User, Meal, Notification, Menu
-
-# Store the last fetched orders timestamp globally (in-memory storage for simplicity)
-last_fetched_time = None
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context
+from auth_context import user_required, get_current_user
+from datetime import datetime, timedelta
+from models import db, Order, User, Meal, Notification, Menu, DailyRevenue
+import availability
+import capacity
+import events
+import order_intake
+from sqlalchemy import and_, or_, tuple_, update
+from pagination import parse_limit, parse_int_arg, encode_cursor, decode_cursor
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -18,14 +24,14 @@ def is_admin(user):
     return user and user.role == "admin"
 
 @order_bp.route('/orders/add', methods=['POST'])
-@jwt_required()
+@user_required()
 def add_order_route():
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-
-    if not user:
-        logging.debug(f"User not found for email: {email}")
-        return jsonify({'message': 'User not found'}), 404
+    """
+    Place a basket of orders. Each item is {menu_id, meal_id, quantity}.
+    Prices come from the meals table, never from the client, and the whole basket
+    costs the same number of queries whatever its size.
+    """
+    user = get_current_user()
 
     try:
         data = request.get_json()
@@ -36,40 +42,40 @@ def add_order_route():
             logging.debug(f"Invalid items format received: {items}")
             return jsonify({'message': 'Invalid items format, expected an array'}), 400
 
-        order_date = datetime.today().date()
-        total_price = 0.0
-        orders = []
-
-        for item in items:
-            menu_id = item.get('menu_id') or item.get('id')
-            quantity = item.get('quantity', 1)
-            price = item.get('price', 0.0)
-
-            menu = Menu.query.get(menu_id)
-            if not menu:
-                logging.debug(f"Menu not found for id: {menu_id}")
-                return jsonify({'message': f'Menu with id {menu_id} not found'}), 404
-
-            total_price += price * quantity
-
-            new_order = Order(
-                user_id=user.id,
-                menu_id=menu.id,
-                date=order_date,
-                quantity=quantity,
-                total_price=price * quantity,
-                payment_status=False  # Default to "Not Paid"
-            )
-            orders.append(new_order)
-
-        db.session.add_all(orders)
+        order_rows, error = build_order_rows(user.id, items)
+        if error:
+            return error
+
+        total_price = sum(row['total_price'] for row in order_rows)
+
+        if current_app.config.get('ORDER_INTAKE_MODE') == 'queued':
+            # Acknowledge once queued; the intake worker group-commits it with other baskets
+            try:
+                intake_id = order_intake.submit(user.id, order_rows)
+            except order_intake.IntakeUnavailable:
+                return jsonify({'message': 'Order could not be queued, please try again'}), 503
+            return jsonify({
+                'message': 'Order accepted',
+                'intake_id': intake_id,
+                'status': order_intake.QUEUED,
+                'total_price': total_price,
+                'payment_status': "Not Paid"
+            }), 202
+
+        # One conditional UPDATE reserves the portions, one multi-row INSERT for the whole basket
+        try:
+            created = order_intake.write_orders(order_rows)
+        except capacity.SoldOut as e:
+            db.session.rollback()
+            return jsonify({'message': 'Not enough portions left', 'items': capacity.shortages(e.wanted)}), 409
         db.session.commit()
+        order_intake.announce(created)
         logging.debug(f"Order created successfully for user {user.id}")
 
         return jsonify({
             'message': 'Order placed successfully',
             'total_price': total_price,
-            'payment_status': "Paid" if new_order.payment_status else "Not Paid"
+            'payment_status': "Not Paid"
         }), 201
 
     except Exception as e:
@@ -78,21 +84,202 @@ def add_order_route():
         return jsonify({'message': 'Internal server error'}), 500
 
 
+def build_order_rows(user_id, items):
+    """
+    Validate basket items and price them server-side.
+    Returns (rows ready for INSERT, None) or (None, error response).
+    Menu membership comes from the availability index; prices are one query.
+    """
+    parsed = []
+    for item in items:
+        if not isinstance(item, dict):
+            return None, (jsonify({'message': 'Each item must be an object'}), 400)
+
+        menu_id = item.get('menu_id') or item.get('id')
+        meal_id = item.get('meal_id')
+        quantity = item.get('quantity', 1)
+
+        if meal_id is None:
+            return None, (jsonify({'message': 'Each item needs a meal_id'}), 400)
+
+        try:
+            menu_id = int(menu_id)
+            meal_id = int(meal_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            return None, (jsonify({'message': 'menu_id, meal_id and quantity must be integers'}), 400)
+
+        if quantity < 1:
+            return None, (jsonify({'message': 'quantity must be at least 1'}), 400)
+
+        parsed.append((menu_id, meal_id, quantity))
+
+    menus = availability.for_menus(menu_id for menu_id, _, _ in parsed)
+    for menu_id, meal_id, _ in parsed:
+        menu = menus.get(menu_id)
+        if not menu:
+            logging.debug(f"Menu not found for id: {menu_id}")
+            return None, (jsonify({'message': f'Menu with id {menu_id} not found'}), 404)
+        if meal_id not in menu.meal_ids:
+            return None, (jsonify({'message': f'Meal with id {meal_id} is not on menu {menu_id}'}), 404)
+
+    prices = dict(
+        db.session.query(Meal.id, Meal.price)
+        .filter(Meal.id.in_({meal_id for _, meal_id, _ in parsed}))
+        .all()
+    )
+
+    now = datetime.utcnow()
+    order_date = datetime.combine(now.date(), datetime.min.time())
+    rows = []
+    for menu_id, meal_id, quantity in parsed:
+        price = prices.get(meal_id)
+        if price is None:
+            return None, (jsonify({'message': f'Meal with id {meal_id} not found'}), 404)
+        rows.append({
+            'user_id': user_id,
+            'menu_id': menu_id,
+            'meal_id': meal_id,
+            'date': order_date,
+            'quantity': quantity,
+            'total_price': price * quantity,
+            'status': 'pending',
+            'payment_status': False,  # Default to "Not Paid"
+            'created_at': now,
+            'updated_at': now,
+        })
+    return rows, None
+
+
+# Status of a basket placed in queued intake mode
+@order_bp.route('/orders/intake/<intake_id>', methods=['GET'])
+@user_required()
+def get_intake_status(intake_id):
+    user = get_current_user()
+
+    status = order_intake.status(intake_id)
+    if not status or (status['user_id'] != user.id and not is_admin(user)):
+        return jsonify({'message': 'Intake not found'}), 404
+
+    response = {'intake_id': intake_id, 'status': status['status']}
+    if status.get('error'):
+        response['error'] = status['error']
+    return jsonify(response), 200
+
+
+
+# Kitchen workflow: each status may only move forward along this list
+ORDER_STATUSES = ['pending', 'preparing', 'ready', 'delivered']
+
+@order_bp.route('/orders/status', methods=['PATCH'])
+@user_required('admin', 'caterer')
+def update_order_status():
+    """
+    Move many orders to one status in a single UPDATE (admins, or caterers for their own meals).
+    Body: {"status": "ready", "orders": [{"id": 1, "updated_at": "<as last read, or null>"}, ...]}
+    An order only changes if it is unchanged since it was read (same updated_at) and the
+    move is forward. Each id gets a result: updated, conflict, invalid_transition or not_found.
+    """
+    user = get_current_user()
+
+    data = request.get_json() or {}
+    status = data.get('status')
+    if status not in ORDER_STATUSES[1:]:
+        return jsonify({'message': f'status must be one of {ORDER_STATUSES[1:]}'}), 400
+
+    items = data.get('orders')
+    max_orders = current_app.config.get('ORDER_STATUS_BATCH_MAX', 1000)
+    if not isinstance(items, list) or not items:
+        return jsonify({'message': 'orders must be a non-empty array'}), 400
+    if len(items) > max_orders:
+        return jsonify({'message': f'At most {max_orders} orders per request'}), 400
+
+    expected = {}
+    try:
+        for item in items:
+            # Older rows may never have had updated_at set: the listings send null for them
+            updated_at = item['updated_at']
+            expected[int(item['id'])] = datetime.fromisoformat(updated_at) if updated_at is not None else None
+    except (TypeError, KeyError, ValueError):
+        return jsonify({'message': 'Each order needs an integer id and its updated_at (ISO 8601 or null)'}), 400
+
+    unchanged = []
+    dated = [(order_id, updated_at) for order_id, updated_at in expected.items() if updated_at is not None]
+    undated = [order_id for order_id, updated_at in expected.items() if updated_at is None]
+    if dated:
+        unchanged.append(tuple_(Order.id, Order.updated_at).in_(dated))
+    if undated:
+        unchanged.append(and_(Order.id.in_(undated), Order.updated_at.is_(None)))
+
+    scope = []
+    if user.role == 'caterer':
+        scope.append(Order.meal_id.in_(db.session.query(Meal.id).filter(Meal.caterer_id == user.id)))
+
+    now = datetime.utcnow()
+    earlier = ORDER_STATUSES[:ORDER_STATUSES.index(status)]
+    updated = db.session.execute(
+        update(Order.__table__)
+        .where(or_(*unchanged))
+        .where(Order.status.in_(earlier), *scope)
+        .values(status=status, updated_at=now)
+        .returning(Order.id, Order.user_id)
+    ).all()
+    db.session.commit()
+    _announce_status(updated, status, now)
+
+    results = {row.id: {'id': row.id, 'result': 'updated', 'updated_at': now.isoformat()}
+               for row in updated}
+
+    # Explain the rest with one read; skipped entirely when everything applied
+    missed = [order_id for order_id in expected if order_id not in results]
+    if missed:
+        current = {
+            row.id: row for row in db.session.query(Order.id, Order.status, Order.updated_at)
+            .filter(Order.id.in_(missed), *scope).all()
+        }
+        for order_id in missed:
+            row = current.get(order_id)
+            if not row:
+                results[order_id] = {'id': order_id, 'result': 'not_found'}
+                continue
+            result = 'conflict' if row.updated_at != expected[order_id] else 'invalid_transition'
+            results[order_id] = {'id': order_id, 'result': result, 'status': row.status,
+                                 'updated_at': row.updated_at.isoformat() if row.updated_at else None}
+
+    return jsonify({
+        'status': status,
+        'updated': len(updated),
+        'results': [results[order_id] for order_id in expected]
+    }), 200
+
+
+def _announce_status(updated, status, updated_at):
+    """Publish a status change to the kitchen feed and to each affected customer."""
+    if not updated:
+        return
+    change = {'status': status, 'updated_at': updated_at.isoformat()}
+    events.publish(events.KITCHEN, 'order.status', {**change, 'ids': [row.id for row in updated]})
+
+    by_user = {}
+    for row in updated:
+        by_user.setdefault(row.user_id, []).append(row.id)
+    for user_id, ids in by_user.items():
+        events.publish(events.user_channel(user_id), 'order.status', {**change, 'ids': ids})
+
 
 # Get All Orders (Admin Only)
 # Get All Orders (Admin Only)
 @order_bp.route('/orders/admin-history', methods=['GET'])
-@jwt_required()
+@user_required('admin')
 def get_orders():
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-
-    if not is_admin(user):
-        logging.debug(f"Unauthorized access attempt by user: {email}")
-        return jsonify({'message': 'Unauthorized. Admins only.'}), 403
-
-    # Fetch all orders without filtering by date
-    orders = Order.query.all()
+    # Columns only: this listing never touches the user/menu/meal relationships
+    query = db.session.query(
+        Order.id, Order.user_id, Order.menu_id, Order.meal_id, Order.date,
+        Order.quantity, Order.total_price, Order.status, Order.updated_at
+    )
+    orders, next_cursor, error = _page_orders(query)
+    if error:
+        return error
 
     return jsonify({'orders': [
         {
@@ -104,20 +291,151 @@ def get_orders():
             'quantity': order.quantity,
             'total_price': order.total_price,
             'status': order.status,  # Order status (e.g., pending, completed)
+            'updated_at': order.updated_at.isoformat() if order.updated_at else None,
         }
         for order in orders
-    ]})
+    ], 'next_cursor': next_cursor})
+
+
+def _page_orders(query):
+    """
+    Apply the admin history filters and one keyset page on (date, id), newest first.
+    Query params: limit, cursor, plus the filters read by _filter_orders.
+    Returns (rows, next_cursor, None) or (None, None, error response).
+    """
+    limit = parse_limit()
+    if limit is None:
+        return None, None, (jsonify({'message': 'limit must be an integer'}), 400)
+
+    query, error = _filter_orders(query)
+    if error:
+        return None, None, error
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            return None, None, (jsonify({'message': 'Invalid cursor. Use next_cursor from a previous page.'}), 400)
+        query = query.filter(tuple_(Order.date, Order.id) < tuple_(*after))
+
+    rows = query.order_by(Order.date.desc(), Order.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].date, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor, None
+
+
+def _filter_orders(query):
+    """
+    Apply order filters from the query string: status, from, to (YYYY-MM-DD), user_id.
+    Returns (query, None) or (None, error response).
+    """
+    try:
+        user_id = parse_int_arg('user_id')
+        start = _parse_day(request.args.get('from'))
+        end = _parse_day(request.args.get('to'))
+    except ValueError:
+        return None, (jsonify({'message': 'Invalid filter. Use YYYY-MM-DD dates and an integer user_id.'}), 400)
+
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Order.status == status)
+    if user_id is not None:
+        query = query.filter(Order.user_id == user_id)
+    if start:
+        query = query.filter(Order.date >= start)
+    if end:
+        query = query.filter(Order.date < end + timedelta(days=1))
+    return query, None
+
+
+def _parse_day(value):
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+# Export orders as CSV or NDJSON (Admin Only)
+EXPORT_COLUMNS = ['id', 'order_date', 'user_id', 'customer_name', 'customer_email', 'menu_id', 'menu_date',
+                  'meal_id', 'meal', 'quantity', 'total_price', 'status', 'payment_status']
+
+@order_bp.route('/orders/export', methods=['GET'])
+@user_required('admin')
+def export_orders():
+    """
+    Stream every matching order as CSV (default) or NDJSON (?format=ndjson).
+    Rows are read through a server-side cursor and written in chunks, so memory
+    stays flat however many orders there are. Accepts the admin history filters.
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'message': 'format must be csv or ndjson'}), 400
+
+    query = db.session.query(
+        Order.id, Order.date.label('order_date'), Order.user_id,
+        User.username.label('customer_name'), User.email.label('customer_email'),
+        Order.menu_id, Menu.date.label('menu_date'), Order.meal_id, Meal.name.label('meal'),
+        Order.quantity, Order.total_price, Order.status, Order.payment_status
+    ).join(User, Order.user_id == User.id)\
+        .outerjoin(Menu, Order.menu_id == Menu.id)\
+        .outerjoin(Meal, Order.meal_id == Meal.id)
+    query, error = _filter_orders(query)
+    if error:
+        return error
+
+    chunk_size = current_app.config.get('ORDER_EXPORT_CHUNK_SIZE', 1000)
+    rows = query.order_by(Order.id).yield_per(chunk_size)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(EXPORT_COLUMNS)
+
+        pending = 0
+        for row in rows:
+            record = _export_record(row)
+            if fmt == 'csv':
+                writer.writerow([record[column] for column in EXPORT_COLUMNS])
+            else:
+                buffer.write(json.dumps(record) + '\n')
+            pending += 1
+
+            if pending >= chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    filename = f"orders-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+def _export_record(row):
+    return {
+        'id': row.id,
+        'order_date': row.order_date.strftime('%Y-%m-%d %H:%M:%S'),
+        'user_id': row.user_id,
+        'customer_name': row.customer_name,
+        'customer_email': row.customer_email,
+        'menu_id': row.menu_id,
+        'menu_date': row.menu_date.strftime('%Y-%m-%d') if row.menu_date else None,
+        'meal_id': row.meal_id,
+        'meal': row.meal,
+        'quantity': row.quantity,
+        'total_price': row.total_price,
+        'status': row.status,
+        'payment_status': 'Paid' if row.payment_status else 'Not Paid',
+    }
 
 @order_bp.route('/orders/revenue', methods=['GET'])
-@jwt_required()
+@user_required('admin')
 def get_revenue():
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-
-    if not is_admin(user):
-        logging.debug(f"Unauthorized access attempt by user: {email}")
-        return jsonify({'message': 'Unauthorized. Admins only.'}), 403
-
     # Get date from query parameters, default to today
     date_str = request.args.get('date', datetime.utcnow().strftime('%Y-%m-%d'))
     
@@ -129,39 +447,65 @@ def get_revenue():
     # Log the date to ensure correct date is being passed
     logging.debug(f"Fetching revenue for date: {date_obj}")
 
-    # Check if there are orders for the given date
-    orders_today = Order.query.filter(db.func.date(Order.date) == date_obj).all()
-    for order in orders_today:
-        logging.debug(f"Order ID: {order.id}, Date: {order.date}, Total Price: {order.total_price}")
-
-    # Calculate total revenue and order count for the given date
-    revenue = db.session.query(db.func.sum(Order.total_price)) \
-        .filter(db.func.date(Order.date) == date_obj) \
-        .scalar()
-
-    order_count = db.session.query(db.func.count(Order.id)) \
-        .filter(db.func.date(Order.date) == date_obj) \
-        .scalar()
+    # One primary-key lookup on the daily rollup
+    rollup = db.session.get(DailyRevenue, date_obj)
+    revenue = rollup.revenue if rollup else 0
+    order_count = rollup.order_count if rollup else 0
 
     logging.debug(f"Total revenue for {date_obj}: {revenue}, Total orders: {order_count}")
     
     return jsonify({
-        'revenue': revenue if revenue is not None else 0,
-        'total_orders': order_count if order_count is not None else 0
+        'revenue': revenue,
+        'total_orders': order_count
+    })
+
+
+@order_bp.route('/orders/revenue/range', methods=['GET'])
+@user_required('admin')
+def get_revenue_range():
+    """Daily revenue and order counts between ?from= and ?to= (inclusive), read from the rollup."""
+    try:
+        start = datetime.strptime(request.args.get('from', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('to', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'message': 'from and to are required. Use YYYY-MM-DD.'}), 400
+
+    if end < start:
+        return jsonify({'message': 'to must not be before from'}), 400
+
+    max_days = current_app.config.get('REVENUE_RANGE_MAX_DAYS', 731)
+    if (end - start).days + 1 > max_days:
+        return jsonify({'message': f'Date range cannot exceed {max_days} days'}), 400
+
+    rollups = {
+        row.day: row for row in DailyRevenue.query
+        .filter(DailyRevenue.day >= start, DailyRevenue.day <= end).all()
+    }
+
+    days = []
+    day = start
+    while day <= end:
+        row = rollups.get(day)
+        days.append({
+            'date': day.strftime('%Y-%m-%d'),
+            'revenue': row.revenue if row else 0,
+            'total_orders': row.order_count if row else 0
+        })
+        day += timedelta(days=1)
+
+    return jsonify({
+        'days': days,
+        'revenue': sum(row.revenue for row in rollups.values()),
+        'total_orders': sum(row.order_count for row in rollups.values())
     })
 
 
 # Order History for Customers
 # Order History for Customers
 @order_bp.route('/orders/history', methods=['GET'])
-@jwt_required()
+@user_required()
 def get_order_history():
-    email = get_jwt_identity()
-    user = User.query.filter_by(email=email).first()
-
-    if not user:
-        logging.debug(f"User not found for email: {email}")
-        return jsonify({'message': 'User not found'}), 404
+    user = get_current_user()
 
     orders = Order.query.filter_by(user_id=user.id).all()
 
@@ -180,36 +524,34 @@ def get_order_history():
 
 
 
-# Admin Order History (Admin Only)@order_bp.route('/order-history', methods=['GET'])
-@jwt_required()  # Ensures the user is logged in
+# Admin Order History (Admin Only)
+@order_bp.route('/order-history', methods=['GET'])
+@user_required('admin', denied={"message": "Access denied. Admins only."})
 def get_admin_order_history():
-    email = get_jwt_identity()  # Get the email of the current user
-    
-    # Fetch the user from the database based on the email
-    user = User.query.filter_by(email=email).first()
-    
-    if not user:
-        return jsonify({"message": "User not found"}), 404
-    
-    # Check if the user is an admin
-    if user.role != 'admin':
-        return jsonify({"message": "Access denied. Admins only."}), 403
-    
-    # Query all orders from the database
-    orders = Order.query.all()
+    # One joined query per page instead of lazy-loading user, menu and meal per order
+    query = db.session.query(
+        Order.id, Order.date, Order.quantity, Order.status, Order.updated_at,
+        User.username, Menu.date.label('menu_date'), Meal.name.label('meal_name')
+    ).join(User, Order.user_id == User.id)\
+        .outerjoin(Menu, Order.menu_id == Menu.id)\
+        .outerjoin(Meal, Order.meal_id == Meal.id)
+    orders, next_cursor, error = _page_orders(query)
+    if error:
+        return error
     
     # Serialize orders to return to the frontend
     order_list = [{
         'id': order.id,
-        'customer_name': order.user.username,  # Using 'username' as the customer name
-        'menu_date': order.menu.date.strftime('%Y-%m-%d') if order.menu else "No menu assigned",  # Use 'menu_date'
-        'meal': order.meal.name if order.meal else "No meal assigned",  # Use 'meal' name (not ID)
+        'customer_name': order.username,  # Using 'username' as the customer name
+        'menu_date': order.menu_date.strftime('%Y-%m-%d') if order.menu_date else "No menu assigned",  # Use 'menu_date'
+        'meal': order.meal_name if order.meal_name else "No meal assigned",  # Use 'meal' name (not ID)
         'quantity': order.quantity,
         'status': order.status,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,  # Send back with status changes
         'order_date': order.date.strftime('%Y-%m-%d %H:%M:%S')  # Format the order date
     } for order in orders]
     
-    return jsonify({"orders": order_list}), 200
+    return jsonify({"orders": order_list, "next_cursor": next_cursor}), 200
 
 
 
@@ -1,12 +1,16 @@
 from flask import jsonify, request, Blueprint, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token
+from auth_context import user_required, get_current_user, invalidate_user
 from datetime import datetime
 from flask_cors import cross_origin
 from extensions import db, mail  # Assuming `db` and `mail` are initialized in extensions.py
 from flask_mail import Message
 from itsdangerous import URLSafeTimedSerializer
-from models import User, Meal, TokenBlocklist
+from models import User, Meal, Order, TokenBlocklist, UserRevocation
+from sqlalchemy import select
+import revocation
+import rollups
 
 user_bp = Blueprint("user_bp", __name__)
 
@@ -49,25 +53,35 @@ def add_user():
 
 # Update user details (username, email, password, and role)
 @user_bp.route("/users/<int:user_id>", methods=["PATCH"])
-@jwt_required()
+@user_required()
 def update_user(user_id):
-    current_user_id = get_jwt_identity()
+    current = get_current_user()
+    is_admin = current.role == 'admin'
+
+    # Users may edit their own details; anyone else's, and any role, need an admin
+    if current.id != user_id and not is_admin:
+        return jsonify({"error": "Unauthorized to update this user"}), 403
+
+    data = request.get_json()
+    new_role = data.get('role')
+    if new_role and not is_admin:
+        return jsonify({"error": "Only admins can change roles"}), 403
+
     user = User.query.get(user_id)  # User to be updated
 
     if not user:
         return jsonify({"error": "User doesn't exist"}), 404
 
-    data = request.get_json()
     username = data.get('username', user.username)
     email = data.get('email', user.email)
     password = data.get('password')
-    new_role = data.get('role')
 
     # Validate role (optional, if role changes are needed)
     if new_role and new_role not in ["customer", "admin", "caterer"]:
         return jsonify({"error": "Invalid role"}), 400
 
-    user.role = new_role if new_role else user.role  # Allow role update without restriction
+    revoke_tokens = bool(new_role) and new_role != user.role
+    user.role = new_role if new_role else user.role
 
     # Check if the new username or email already exists
     if username != user.username and User.query.filter_by(username=username).first():
@@ -77,12 +91,20 @@ def update_user(user_id):
         return jsonify({"error": "Email already exists"}), 409
 
     # Apply updates
+    previous_email = user.email
     user.username = username
     user.email = email
     if password:
         user.set_password(password)
+    now = datetime.utcnow()
+    if revoke_tokens:
+        # Tokens carry the role as a claim: every token issued with the old one must go
+        db.session.add(UserRevocation(user_id=user.id, revoked_at=now))
 
     db.session.commit()
+    invalidate_user(previous_email, user.email)
+    if revoke_tokens:
+        revocation.revoke_user(user.id, now)
     return jsonify({
         "success": "User updated successfully",
         "new_role": user.role
@@ -91,16 +113,25 @@ def update_user(user_id):
 
 # Delete user
 @user_bp.route("/users/<int:user_id>", methods=["DELETE"])
-@jwt_required()
+@user_required()
 def delete_user(user_id):
-    current_user_id = get_jwt_identity()
     user = User.query.get(user_id)
 
-    if not user or user.id != current_user_id:
+    # Users may only delete themselves (the JWT identity is an email, so compare ids)
+    if not user or user.id != get_current_user().id:
         return jsonify({"error": "User doesn't exist or unauthorized to delete this user"}), 404
 
+    email = user.email
+    now = datetime.utcnow()
+    # Tokens outlive the account: revoke every one of them, on every worker
+    db.session.add(UserRevocation(user_id=user_id, revoked_at=now))
+    # The cascade takes the user's orders and meals (with every order for them): out of the rollups first
+    rollups.forget_meals(select(Meal.id).where(Meal.caterer_id == user_id))
+    rollups.delete_orders(Order.user_id == user_id)
     db.session.delete(user)
     db.session.commit()
+    invalidate_user(email)
+    revocation.revoke_user(user_id, now)
     return jsonify({"success": "User deleted successfully"}), 200
 
 
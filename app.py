@@ -12,12 +12,22 @@ from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
 from werkzeug.security import generate_password_hash
 from models import User, Meal, Order, Menu, Notification, TokenBlocklist
+import availability
+import events
+import order_intake
+import rollups
+import instrumentation
+import retention
+import revocation
 from Views.auth import auth_bp
 from Views.user import user_bp
 from Views.meal import meal_bp
 from Views.menu import menu_bp
 from Views.order import order_bp
 from Views.notifications import notifications_bp
+from Views.analytics import analytics_bp
+from Views.admin import admin_bp
+from Views.events import events_bp
 
 from flask_cors import CORS
 from dotenv import load_dotenv
@@ -64,10 +74,77 @@ app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'your_other_secret_key'
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = 9000
 app.config["JWT_REFRESH_TOKEN_EXPIRES"] = 86400
 
+# Optional shared Redis tier for caches (leave unset to run per-worker only). With it, invalidations
+# reach every worker at once; without it, other workers' local copies expire after their TTL
+app.config['REDIS_URL'] = os.getenv('REDIS_URL')
+app.config['MENU_CACHE_SIZE'] = int(os.getenv('MENU_CACHE_SIZE', 64))
+app.config['MENU_CACHE_TTL'] = int(os.getenv('MENU_CACHE_TTL', 30))
+app.config['MENU_CACHE_REDIS_TTL'] = int(os.getenv('MENU_CACHE_REDIS_TTL', 300))
+app.config['MENU_RANGE_MAX_DAYS'] = int(os.getenv('MENU_RANGE_MAX_DAYS', 62))
+
+# Menu availability index: days ahead to warm at startup, and seconds before an entry is re-read
+app.config['MENU_AVAILABILITY_DAYS'] = int(os.getenv('MENU_AVAILABILITY_DAYS', 14))
+app.config['MENU_AVAILABILITY_TTL'] = int(os.getenv('MENU_AVAILABILITY_TTL', 300))
+
+# Bulk meal import: rows per INSERT batch/transaction and max per-row errors reported
+app.config['MEAL_IMPORT_BATCH_SIZE'] = int(os.getenv('MEAL_IMPORT_BATCH_SIZE', 5000))
+app.config['MEAL_IMPORT_MAX_ERRORS'] = int(os.getenv('MEAL_IMPORT_MAX_ERRORS', 1000))
+
+# Meal search: 'memory' (per-worker trigram index) or 'pg_trgm' (Postgres GIN index)
+app.config['MEAL_SEARCH_BACKEND'] = os.getenv('MEAL_SEARCH_BACKEND', 'memory')
+app.config['MEAL_SEARCH_INDEX_TTL'] = int(os.getenv('MEAL_SEARCH_INDEX_TTL', 300))
+app.config['MEAL_SEARCH_MIN_SIMILARITY'] = float(os.getenv('MEAL_SEARCH_MIN_SIMILARITY', 0.5))
+
+# Order export: rows fetched per server-side cursor batch and written per response chunk
+app.config['ORDER_EXPORT_CHUNK_SIZE'] = int(os.getenv('ORDER_EXPORT_CHUNK_SIZE', 1000))
+app.config['REVENUE_RANGE_MAX_DAYS'] = int(os.getenv('REVENUE_RANGE_MAX_DAYS', 731))
+app.config['ANALYTICS_RANGE_MAX_DAYS'] = int(os.getenv('ANALYTICS_RANGE_MAX_DAYS', 731))
+app.config['ORDER_STATUS_BATCH_MAX'] = int(os.getenv('ORDER_STATUS_BATCH_MAX', 1000))
+
+# Server-Sent Events: fan-out is in-process, or across workers through Redis when REDIS_URL is set
+app.config['EVENTS_HEARTBEAT_SECONDS'] = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+app.config['EVENTS_QUEUE_SIZE'] = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+
+# Revoked tokens: each worker checks an in-memory copy of the blocklist, re-read every few seconds
+app.config['REVOCATION_REFRESH_SECONDS'] = int(os.getenv('REVOCATION_REFRESH_SECONDS', 5))
+# How far behind the newest revocation seen each refresh re-reads, for transactions committed out of order
+app.config['REVOCATION_OVERLAP_SECONDS'] = int(os.getenv('REVOCATION_OVERLAP_SECONDS', 60))
+
+# Users behind tokens without uid/role claims (issued before they existed): cached per worker for the TTL
+app.config['AUTH_USER_CACHE_SIZE'] = int(os.getenv('AUTH_USER_CACHE_SIZE', 10000))
+app.config['AUTH_USER_CACHE_SECONDS'] = int(os.getenv('AUTH_USER_CACHE_SECONDS', 30))
+
+# Retention (flask purge-expired): windows in days, 0 keeps forever; rows per DELETE batch
+app.config['RETENTION_READ_NOTIFICATION_DAYS'] = int(os.getenv('RETENTION_READ_NOTIFICATION_DAYS', 30))
+app.config['RETENTION_UNREAD_NOTIFICATION_DAYS'] = int(os.getenv('RETENTION_UNREAD_NOTIFICATION_DAYS', 180))
+app.config['RETENTION_BROADCAST_DAYS'] = int(os.getenv('RETENTION_BROADCAST_DAYS', 30))
+app.config['RETENTION_BLOCKLIST_GRACE_SECONDS'] = int(os.getenv('RETENTION_BLOCKLIST_GRACE_SECONDS', 3600))
+app.config['RETENTION_BATCH_SIZE'] = int(os.getenv('RETENTION_BATCH_SIZE', 5000))
+app.config['RETENTION_BATCH_PAUSE_MS'] = int(os.getenv('RETENTION_BATCH_PAUSE_MS', 50))
+
+# Order intake: 'sync' writes each basket in its request; 'queued' acknowledges with an intake id
+# once the basket is in the Celery broker (CELERY_BROKER_URL), and Celery group-commits baskets.
+# Queued mode needs REDIS_URL for the intake statuses; the in-process 'thread' backend is for tests only
+app.config['ORDER_INTAKE_MODE'] = os.getenv('ORDER_INTAKE_MODE', 'sync')
+app.config['ORDER_INTAKE_BACKEND'] = os.getenv('ORDER_INTAKE_BACKEND', 'celery')
+app.config['ORDER_INTAKE_BATCH_SIZE'] = int(os.getenv('ORDER_INTAKE_BATCH_SIZE', 200))
+app.config['ORDER_INTAKE_FLUSH_MS'] = int(os.getenv('ORDER_INTAKE_FLUSH_MS', 50))
+app.config['ORDER_INTAKE_HANDOVER_SECONDS'] = float(os.getenv('ORDER_INTAKE_HANDOVER_SECONDS', 5))
+app.config['CELERY_BROKER_URL'] = os.getenv('CELERY_BROKER_URL')
+order_intake.check_config(app.config)
+
+# SQL instrumentation: per-request query counts/timing (Server-Timing header), slow-query log, N+1 warnings
+app.config['SQL_INSTRUMENTATION'] = os.getenv('SQL_INSTRUMENTATION', '1') == '1'
+app.config['SQL_SLOW_QUERY_MS'] = float(os.getenv('SQL_SLOW_QUERY_MS', 200))
+app.config['SQL_NPLUS1_THRESHOLD'] = int(os.getenv('SQL_NPLUS1_THRESHOLD', 5))
+
 # Initialize extensions
 db.init_app(app)
+instrumentation.init_app(app)
+events.init_app(app)
 migrate = Migrate(app, db)
 jwt = JWTManager(app)
+jwt.token_in_blocklist_loader(revocation.is_revoked)
 mail = Mail(app)
 
 # Google OAuth Configuration
@@ -95,6 +172,22 @@ app.register_blueprint(meal_bp)
 app.register_blueprint(menu_bp)
 app.register_blueprint(order_bp)
 app.register_blueprint(notifications_bp)
+app.register_blueprint(analytics_bp)
+app.register_blueprint(admin_bp)
+app.register_blueprint(events_bp)
+
+# CLI commands
+app.cli.add_command(rollups.backfill_revenue_command)
+app.cli.add_command(rollups.backfill_meal_stats_command)
+app.cli.add_command(retention.purge_expired_command)
+
+# Warm the menu availability index for upcoming days
+with app.app_context():
+    try:
+        availability.warm()
+    except Exception as e:
+        # Tables may not exist yet (e.g. while running migrations)
+        app.logger.warning(f"Skipping availability warm-up: {e}")
 
 # Home route
 @app.route('/')
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import current_app, g, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from extensions import db
+from models import User
+
+# What authorization needs to know about the user behind a token. A plain snapshot,
+# so it can be shared between requests without holding on to a session.
+CurrentUser = namedtuple('CurrentUser', ['id', 'email', 'role'])
+
+# Tokens carry the user's id and role as claims, so most requests never look the user up.
+# Changing a role or deleting the account revokes the user's tokens (see revocation),
+# which keeps the claims honest.
+UID_CLAIM = 'uid'
+ROLE_CLAIM = 'role'
+# Issue time in milliseconds: iat is whole seconds, too coarse to tell a token issued
+# just after a revocation from one issued just before it
+ISSUED_CLAIM = 'iat_ms'
+
+# Tokens issued before the claims existed still resolve through the database, via a
+# per-worker LRU keyed by email (the JWT identity): {email: (expires_at, CurrentUser)}.
+# Changes made on this worker invalidate their entry at once; other workers see them
+# within AUTH_USER_CACHE_SECONDS.
+_local = OrderedDict()
+_lock = threading.Lock()
+
+ROLE_NAMES = {'admin': 'admins', 'caterer': 'caterers', 'customer': 'customers'}
+
+
+def _settings():
+    config = current_app.config
+    return config.get('AUTH_USER_CACHE_SIZE', 10000), config.get('AUTH_USER_CACHE_SECONDS', 30)
+
+
+def token_claims(user):
+    """additional_claims for create_access_token/create_refresh_token."""
+    return {UID_CLAIM: user.id, ROLE_CLAIM: user.role, ISSUED_CLAIM: int(time.time() * 1000)}
+
+
+def get_current_user():
+    """The CurrentUser behind this request's JWT, or None. Resolved at most once per request."""
+    if 'auth_user' not in g:
+        email = get_jwt_identity()
+        claims = get_jwt()
+        if UID_CLAIM in claims and ROLE_CLAIM in claims:
+            g.auth_user = CurrentUser(claims[UID_CLAIM], email, claims[ROLE_CLAIM])
+        else:
+            g.auth_user = lookup(email) if email else None
+    return g.auth_user
+
+
+def lookup(email):
+    """CurrentUser for an email, from this worker's cache when it is fresh."""
+    size, ttl = _settings()
+    now = time.monotonic()
+    with _lock:
+        entry = _local.get(email)
+        if entry is not None:
+            if entry[0] > now:
+                _local.move_to_end(email)
+                return entry[1]
+            del _local[email]
+
+    row = db.session.query(User.id, User.email, User.role).filter(User.email == email).first()
+    if row is None:
+        return None  # Not cached: a miss costs a query, but never hides a new account
+
+    user = CurrentUser(*row)
+    if ttl > 0:
+        with _lock:
+            _local[email] = (now + ttl, user)
+            _local.move_to_end(email)
+            while len(_local) > size:
+                _local.popitem(last=False)
+    return user
+
+
+def invalidate_user(*emails):
+    """Forget cached users, e.g. after their email, role or account changed."""
+    with _lock:
+        for email in emails:
+            _local.pop(email, None)
+    if 'auth_user' in g and g.auth_user is not None and g.auth_user.email in emails:
+        g.pop('auth_user')
+
+
+def clear():
+    with _lock:
+        _local.clear()
+
+
+def user_required(*roles, denied=None, **jwt_options):
+    """
+    jwt_required() that also resolves the current user (read it with get_current_user()).
+    Answers 403 when roles are given and the user has none of them (denied replaces the
+    default body), and 404 when a token without claims belongs to no user.
+    """
+    def decorator(view):
+        @wraps(view)
+        @jwt_required(**jwt_options)
+        def wrapper(*args, **kwargs):
+            user = get_current_user()
+            if roles and (user is None or user.role not in roles):
+                names = ' and '.join(ROLE_NAMES.get(role, role) for role in roles)
+                return jsonify(denied or {'message': f'Unauthorized. {names.capitalize()} only.'}), 403
+            if user is None:
+                return jsonify({'message': 'User not found'}), 404
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+from flask import current_app
+from extensions import db
+from models import Menu, menu_meals
+import events
+
+# What is on the menu for one date
+Availability = namedtuple('Availability', ['menu_id', 'date', 'meal_ids'])
+
+# Per-worker index: {menu date: (loaded_at, Availability)} plus {menu id: menu date}
+_by_date = {}
+_menu_dates = {}
+_lock = threading.Lock()
+
+
+def _ttl():
+    return current_app.config.get('MENU_AVAILABILITY_TTL', 300)
+
+
+def warm(days=None):
+    """Load today's menu and the next `days` days' menus in a single query."""
+    if days is None:
+        days = current_app.config.get('MENU_AVAILABILITY_DAYS', 14)
+
+    start = date.today()
+    rows = _menu_rows().filter(Menu.date >= start, Menu.date <= start + timedelta(days=days)).all()
+    loaded = _group(rows)
+    for item in loaded.values():
+        _store(item)
+    logging.debug(f"Availability index warmed with {len(loaded)} menu(s) from {start}")
+    return len(loaded)
+
+
+def for_date(menu_date):
+    """Availability for a menu date, or None when there is no menu that day."""
+    entry = _by_date.get(menu_date)
+    if entry and time.monotonic() - entry[0] < _ttl():
+        return entry[1]
+
+    # Outside the warmed window or stale: load just this date
+    loaded = _group(_menu_rows().filter(Menu.date == menu_date).all())
+    item = loaded.get(menu_date)
+    if item:
+        _store(item)
+    else:
+        _forget(menu_date)
+    return item
+
+
+def for_menu(menu_id):
+    """Availability for a menu id, or None when the menu does not exist."""
+    menu_date = _menu_dates.get(menu_id)
+    if menu_date is not None:
+        entry = _by_date.get(menu_date)
+        if entry and time.monotonic() - entry[0] < _ttl():
+            return entry[1]
+
+    loaded = _group(_menu_rows().filter(Menu.id == menu_id).all())
+    item = next(iter(loaded.values()), None)
+    if item:
+        _store(item)
+    return item
+
+
+def for_menus(menu_ids):
+    """Availability for several menu ids at once: {menu id: Availability}. Misses load in one query."""
+    found = {}
+    missing = []
+    now = time.monotonic()
+    for menu_id in set(menu_ids):
+        entry = _by_date.get(_menu_dates.get(menu_id))
+        if entry and now - entry[0] < _ttl():
+            found[menu_id] = entry[1]
+        else:
+            missing.append(menu_id)
+
+    if missing:
+        for item in _group(_menu_rows().filter(Menu.id.in_(missing)).all()).values():
+            _store(item)
+            found[item.menu_id] = item
+    return found
+
+
+def set_menu(menu_id, menu_date, meal_ids):
+    """Record a menu that was just written, without re-reading it; other workers re-read it."""
+    events.publish(events.CACHE, 'availability.menu_changed', {'date': menu_date.isoformat()})
+    _store(Availability(menu_id, menu_date, frozenset(meal_ids)))
+
+
+def discard_meal(meal_id):
+    """Remove a deleted meal from every indexed date, on every worker."""
+    _discard_meal(meal_id)
+    events.publish(events.CACHE, 'availability.meal_removed', {'meal_id': meal_id})
+
+
+def clear():
+    with _lock:
+        _by_date.clear()
+        _menu_dates.clear()
+
+
+def _discard_meal(meal_id):
+    with _lock:
+        for menu_date, (loaded_at, item) in list(_by_date.items()):
+            if meal_id in item.meal_ids:
+                _by_date[menu_date] = (loaded_at, item._replace(meal_ids=item.meal_ids - {meal_id}))
+
+
+def _on_cache_event(event, data):
+    if event == 'availability.menu_changed':
+        # Reloaded from the database on next use (with Redis the writer gets its own echo: one extra query)
+        _forget(date.fromisoformat(data['date']))
+    elif event == 'availability.meal_removed':
+        _discard_meal(data['meal_id'])
+
+
+events.on(events.CACHE, _on_cache_event)
+
+
+def _menu_rows():
+    return db.session.query(Menu.id, Menu.date, menu_meals.c.meal_id)\
+        .outerjoin(menu_meals, menu_meals.c.menu_id == Menu.id)
+
+
+def _group(rows):
+    grouped = {}
+    for menu_id, menu_date, meal_id in rows:
+        menu_id_and_meals = grouped.setdefault(menu_date, (menu_id, set()))
+        if meal_id is not None:
+            menu_id_and_meals[1].add(meal_id)
+    return {
+        menu_date: Availability(menu_id, menu_date, frozenset(meal_ids))
+        for menu_date, (menu_id, meal_ids) in grouped.items()
+    }
+
+
+def _store(item):
+    with _lock:
+        _by_date[item.date] = (time.monotonic(), item)
+        _menu_dates[item.menu_id] = item.date
+
+
+def _forget(menu_date):
+    with _lock:
+        entry = _by_date.pop(menu_date, None)
+        if entry:
+            _menu_dates.pop(entry[1].menu_id, None)
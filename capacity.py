@@ -0,0 +1,125 @@
+from collections import Counter
+
+from sqlalchemy import and_, case, or_, select, tuple_, update
+from extensions import db
+from models import Order, menu_meals
+
+# Portions per (menu, meal) live on menu_meals: capacity is what the kitchen cooks,
+# remaining is what is left to sell. NULL in both means unlimited.
+
+
+class SoldOut(Exception):
+    """Raised by reserve() when a basket asks for more portions than are left."""
+
+    def __init__(self, wanted):
+        super().__init__('Not enough portions left')
+        self.wanted = wanted
+
+
+def _wanted(order_rows):
+    wanted = Counter()
+    for row in order_rows:
+        wanted[(row['menu_id'], row['meal_id'])] += row['quantity']
+    return wanted
+
+
+def reserve(order_rows):
+    """
+    Take the basket's portions in one conditional UPDATE. Only rows with enough
+    left (or no limit) match, so a short row means the basket cannot be served:
+    SoldOut is raised and the caller must roll back. No reads, no table locks.
+    """
+    wanted = _wanted(order_rows)
+    pair = tuple_(menu_meals.c.menu_id, menu_meals.c.meal_id)
+    quantity = case(
+        *[(and_(menu_meals.c.menu_id == menu_id, menu_meals.c.meal_id == meal_id), portions)
+          for (menu_id, meal_id), portions in wanted.items()]
+    )
+    result = db.session.execute(
+        update(menu_meals)
+        .where(pair.in_(list(wanted)))
+        .where(or_(menu_meals.c.remaining.is_(None), menu_meals.c.remaining >= quantity))
+        .values(remaining=menu_meals.c.remaining - quantity)
+    )
+    if result.rowcount != len(wanted):
+        raise SoldOut(wanted)
+
+
+def shortages(wanted):
+    """After a SoldOut rollback: the items that could not be served and what is left of them."""
+    rows = db.session.execute(
+        select(menu_meals.c.menu_id, menu_meals.c.meal_id, menu_meals.c.remaining)
+        .where(tuple_(menu_meals.c.menu_id, menu_meals.c.meal_id).in_(list(wanted)))
+    ).all()
+    left = {(row.menu_id, row.meal_id): row.remaining for row in rows}
+
+    short = []
+    for (menu_id, meal_id), portions in wanted.items():
+        # A pair that vanished was taken off the menu while the order was in flight
+        remaining = left.get((menu_id, meal_id), 0)
+        if remaining is not None and remaining < portions:
+            short.append({'menu_id': menu_id, 'meal_id': meal_id, 'requested': portions, 'remaining': remaining})
+    return short
+
+
+def set_capacities(menu_id, capacities):
+    """
+    Set portions per meal on a menu: {meal_id: portions, or None for unlimited}.
+    Portions already ordered stay taken, so remaining = portions - sold (never below 0).
+    Returns the meal ids that are not on the menu. Does not commit.
+    """
+    missing = []
+    for meal_id, portions in capacities.items():
+        if portions is None:
+            values = {'capacity': None, 'remaining': None}
+        else:
+            ordered = select(db.func.coalesce(db.func.sum(Order.quantity), 0))\
+                .where(Order.menu_id == menu_id, Order.meal_id == meal_id)\
+                .scalar_subquery()
+            sold = db.func.coalesce(menu_meals.c.capacity - menu_meals.c.remaining, ordered)
+            values = {
+                'capacity': portions,
+                'remaining': case((sold > portions, 0), else_=portions - sold)
+            }
+
+        result = db.session.execute(
+            update(menu_meals)
+            .where(menu_meals.c.menu_id == menu_id, menu_meals.c.meal_id == meal_id)
+            .values(**values)
+        )
+        if result.rowcount == 0:
+            missing.append(meal_id)
+    return missing
+
+
+def parse_capacities(raw):
+    """
+    Validate a {meal_id: portions} object from a request body.
+    Returns (capacities, None) or (None, error message).
+    """
+    if not isinstance(raw, dict):
+        return None, 'capacities must be an object of meal_id: portions'
+
+    capacities = {}
+    for meal_id, portions in raw.items():
+        try:
+            meal_id = int(meal_id)
+            portions = None if portions is None else int(portions)
+        except (TypeError, ValueError):
+            return None, 'meal ids and portions must be integers'
+        if portions is not None and portions < 0:
+            return None, 'portions must not be negative'
+        capacities[meal_id] = portions
+    return capacities, None
+
+
+def for_menus(menu_ids):
+    """{menu_id: {meal_id: (capacity, remaining)}} for the limited meals on these menus, in one query."""
+    rows = db.session.execute(
+        select(menu_meals.c.menu_id, menu_meals.c.meal_id, menu_meals.c.capacity, menu_meals.c.remaining)
+        .where(menu_meals.c.menu_id.in_(list(menu_ids)), menu_meals.c.capacity.is_not(None))
+    ).all()
+    limits = {}
+    for row in rows:
+        limits.setdefault(row.menu_id, {})[row.meal_id] = (row.capacity, row.remaining)
+    return limits
@@ -0,0 +1,74 @@
+from extensions import db
+from models import User, Meal, MealDailyStats
+
+# Caterer earnings, read from the per-(day, meal) sales counters.
+# Each function is one grouped aggregate: its cost depends on days x meals, not on order volume.
+
+
+def _base(columns, start, end, caterer_id):
+    query = db.session.query(*columns)\
+        .join(Meal, Meal.id == MealDailyStats.meal_id)\
+        .filter(MealDailyStats.day >= start, MealDailyStats.day <= end)
+    if caterer_id is not None:
+        query = query.filter(Meal.caterer_id == caterer_id)
+    return query
+
+
+def _totals():
+    return (
+        db.func.coalesce(db.func.sum(MealDailyStats.revenue), 0).label('earnings'),
+        db.func.coalesce(db.func.sum(MealDailyStats.quantity), 0).label('quantity'),
+        db.func.coalesce(db.func.sum(MealDailyStats.order_count), 0).label('orders'),
+    )
+
+
+def total(start, end, caterer_id=None):
+    """Total earnings for one caterer (or everyone) between start and end inclusive."""
+    row = _base(_totals(), start, end, caterer_id).one()
+    return {'earnings': row.earnings, 'quantity': row.quantity, 'orders': row.orders}
+
+
+def by_caterer(start, end, caterer_id=None):
+    """Earnings per caterer, highest first."""
+    earnings, quantity, orders = _totals()
+    rows = _base((Meal.caterer_id, User.username, earnings, quantity, orders), start, end, caterer_id)\
+        .join(User, User.id == Meal.caterer_id)\
+        .group_by(Meal.caterer_id, User.username)\
+        .order_by(earnings.desc(), Meal.caterer_id).all()
+    return [{
+        'caterer_id': row.caterer_id,
+        'caterer': row.username,
+        'earnings': row.earnings,
+        'quantity': row.quantity,
+        'orders': row.orders
+    } for row in rows]
+
+
+def by_meal(start, end, caterer_id=None):
+    """Earnings per meal, highest first."""
+    earnings, quantity, orders = _totals()
+    rows = _base((Meal.id, Meal.name, Meal.caterer_id, earnings, quantity, orders), start, end, caterer_id)\
+        .group_by(Meal.id, Meal.name, Meal.caterer_id)\
+        .order_by(earnings.desc(), Meal.id).all()
+    return [{
+        'meal_id': row.id,
+        'meal': row.name,
+        'caterer_id': row.caterer_id,
+        'earnings': row.earnings,
+        'quantity': row.quantity,
+        'orders': row.orders
+    } for row in rows]
+
+
+def by_day(start, end, caterer_id=None):
+    """Earnings per day that had sales, oldest first."""
+    earnings, quantity, orders = _totals()
+    rows = _base((MealDailyStats.day, earnings, quantity, orders), start, end, caterer_id)\
+        .group_by(MealDailyStats.day)\
+        .order_by(MealDailyStats.day).all()
+    return [{
+        'date': row.day.strftime('%Y-%m-%d'),
+        'earnings': row.earnings,
+        'quantity': row.quantity,
+        'orders': row.orders
+    } for row in rows]
@@ -0,0 +1,155 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from flask import current_app
+from extensions import get_redis
+
+# Channels clients can be subscribed to
+KITCHEN = 'kitchen'  # New orders and status changes, for admins and caterers
+
+# Internal channel, never streamed to clients: per-worker caches drop entries written elsewhere
+CACHE = 'cache'
+
+
+def user_channel(user_id):
+    """Private channel for one user's notifications and order updates."""
+    return f'user:{user_id}'
+
+
+def role_channel(role):
+    """Broadcast notifications to everyone with a role."""
+    return f'role:{role}'
+
+
+REDIS_PREFIX = 'events:'
+
+# Local subscribers for this worker: {channel: {Subscription}}
+_subscribers = {}
+# In-process handlers, run on every worker for each event on their channel: {channel: [handler(event, data)]}
+_handlers = {}
+_lock = threading.Lock()
+_listener = None
+
+
+class Subscription:
+    """One connected client: a bounded queue of (event, data) fed by the hub."""
+
+    def __init__(self, channels, size):
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=size)
+        self.overflowed = False
+
+    def get(self, timeout):
+        """Next (event, data), or None when nothing arrived within timeout seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # A client this far behind is dropped; it reconnects and re-reads what it missed
+            self.overflowed = True
+
+
+def on(channel, handler):
+    """Call handler(event, data) on every worker for each event published on channel."""
+    _handlers.setdefault(channel, []).append(handler)
+
+
+def init_app(app):
+    """With REDIS_URL, keep this worker's listener running even while no client is connected."""
+    if app.config.get('REDIS_URL'):
+        app.before_request(lambda: _ensure_listener(app))
+
+
+def subscribe(channels):
+    """Register a client for the given channels on this worker."""
+    app = current_app._get_current_object()
+    subscription = Subscription(channels, app.config.get('EVENTS_QUEUE_SIZE', 100))
+    with _lock:
+        for channel in subscription.channels:
+            _subscribers.setdefault(channel, set()).add(subscription)
+
+    if app.config.get('REDIS_URL'):
+        _ensure_listener(app)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        for channel in subscription.channels:
+            members = _subscribers.get(channel)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del _subscribers[channel]
+
+
+def publish(channel, event, data):
+    """
+    Push an event to every client on a channel, on every worker. Best effort:
+    call it after the commit, and a failure here never fails the request.
+    """
+    message = json.dumps({'channel': channel, 'event': event, 'data': data}, default=str)
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            # Every worker's listener (this one included) delivers to its own clients
+            redis_client.publish(REDIS_PREFIX + channel, message)
+            return
+        except Exception as e:
+            logging.warning(f"Events: Redis publish failed, delivering locally only: {e}")
+
+    _deliver(message)
+
+
+def subscriber_count():
+    with _lock:
+        return len({subscription for members in _subscribers.values() for subscription in members})
+
+
+def _deliver(message):
+    decoded = json.loads(message)
+    with _lock:
+        members = list(_subscribers.get(decoded['channel'], ()))
+    for subscription in members:
+        subscription._offer((decoded['event'], decoded['data']))
+    for handler in _handlers.get(decoded['channel'], ()):
+        try:
+            handler(decoded['event'], decoded['data'])
+        except Exception as e:
+            logging.warning(f"Events: handler for {decoded['channel']} failed: {e}")
+
+
+def _ensure_listener(app):
+    global _listener
+    if _listener is not None and _listener.is_alive():
+        return
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, args=(app.config['REDIS_URL'],),
+                                         name='events-listener', daemon=True)
+            _listener.start()
+
+
+def _listen(url):
+    """Relay every channel published on Redis to this worker's local clients."""
+    import redis  # Optional: only needed when a shared tier is configured
+
+    while True:
+        try:
+            pubsub = redis.Redis.from_url(url, health_check_interval=30).pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(REDIS_PREFIX + '*')
+            for item in pubsub.listen():
+                if item.get('type') == 'pmessage':
+                    _deliver(item['data'])
+        except Exception as e:
+            logging.warning(f"Events: Redis listener lost its connection, retrying: {e}")
+            time.sleep(1)
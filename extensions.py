@@ -1,3 +1,4 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
@@ -5,4 +6,18 @@ from flask_mail import Mail
 # Initialize extensions
 db = SQLAlchemy()
 jwt = JWTManager()
-mail = Mail()
\ No newline at end of file
+mail = Mail()
+
+
+def get_redis():
+    """Return the shared Redis client, or None when REDIS_URL is not configured."""
+    url = current_app.config.get('REDIS_URL')
+    if not url:
+        return None
+
+    client = current_app.extensions.get('redis')
+    if client is None:
+        import redis  # Optional: only needed when a shared tier is configured
+        client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        current_app.extensions['redis'] = client
+    return client
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+
+# gunicorn picks this file up from the working directory: gunicorn app:app
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# /events streams stay open for as long as the client is connected. A sync worker would
+# spend a whole process on each one, so workers are gevent: every connection is a
+# greenlet, and a worker holds up to worker_connections of them at once.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Open streams never finish on their own; clients reconnect to another worker
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 10))
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # Let psycopg2 wait on the database cooperatively instead of blocking the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
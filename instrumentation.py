@@ -0,0 +1,110 @@
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from extensions import db
+
+# Placeholders from every DBAPI paramstyle we run on (sqlite "?", psycopg2 "%(name)s")
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|\?')
+_PLACEHOLDER_LIST = re.compile(r'\?(\s*,\s*\?)+')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def init_app(app):
+    """Count, time and inspect every SQL statement run while serving a request."""
+    app.config.setdefault('SQL_INSTRUMENTATION', True)
+    app.config.setdefault('SQL_SLOW_QUERY_MS', 200)
+    app.config.setdefault('SQL_NPLUS1_THRESHOLD', 5)
+    app.config.setdefault('SQL_SLOWEST_KEPT', 3)
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+class RequestStats:
+    """SQL activity for one request."""
+
+    def __init__(self, config):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+        self.slowest = []  # [(ms, statement)], longest first
+        self.slow_ms = config['SQL_SLOW_QUERY_MS']
+        self.keep = config['SQL_SLOWEST_KEPT']
+        self.nplus1_threshold = config['SQL_NPLUS1_THRESHOLD']
+
+    def record(self, statement, elapsed_ms):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+
+        if len(self.slowest) < self.keep or elapsed_ms > self.slowest[-1][0]:
+            self.slowest.append((elapsed_ms, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.keep:]
+
+        if elapsed_ms >= self.slow_ms:
+            logging.warning(f"Slow query ({elapsed_ms:.1f} ms) in {request.endpoint}: {statement}")
+
+    def repeated_shapes(self):
+        """Statement shapes run often enough in one request to look like an N+1."""
+        return [(shape, count) for shape, count in self.shapes.items() if count >= self.nplus1_threshold]
+
+
+def statement_shape(statement):
+    """Normalize a statement so the same query with different parameters compares equal."""
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _PLACEHOLDER_LIST.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return ' '.join(shape.split())
+
+
+def current_stats():
+    """This request's RequestStats, or None outside a request."""
+    if not has_request_context():
+        return None
+    return g.get('sql_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, (time.perf_counter() - started) * 1000)
+
+
+def _start_request():
+    g.sql_stats = RequestStats(current_app.config)
+
+
+def _finish_request(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+
+    timings = [f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"']
+    if stats.slowest:
+        timings.append(f'db-slowest;dur={stats.slowest[0][0]:.1f}')
+    response.headers.add('Server-Timing', ', '.join(timings))
+
+    for shape, count in stats.repeated_shapes():
+        logging.warning(f"Probable N+1 in {request.endpoint}: {count} x {shape[:300]}")
+
+    if stats.slowest:
+        logging.debug(f"{request.method} {request.path}: {stats.count} queries, {stats.total_ms:.1f} ms; "
+                      f"slowest {stats.slowest[0][0]:.1f} ms: {stats.slowest[0][1][:300]}")
+    return response
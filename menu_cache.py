@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from extensions import db, get_redis
+from models import Menu, menu_meals
+import events
+
+# Per-worker LRU of serialized menus keyed by date string: {date: (expires_at, payload, etag)}
+_local = OrderedDict()
+_lock = threading.Lock()
+
+REDIS_PREFIX = 'menu:'
+
+
+def _settings():
+    config = current_app.config
+    return (
+        config.get('MENU_CACHE_SIZE', 64),
+        config.get('MENU_CACHE_TTL', 30),
+        config.get('MENU_CACHE_REDIS_TTL', 300),
+    )
+
+
+def make_etag(payload):
+    """Strong ETag derived from the canonical JSON form of a payload."""
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def get(date_key):
+    """Return (payload, etag) for a menu date, or None on a miss."""
+    now = time.monotonic()
+    with _lock:
+        entry = _local.get(date_key)
+        if entry is not None:
+            if entry[0] > now:
+                _local.move_to_end(date_key)
+                return entry[1], entry[2]
+            del _local[date_key]
+
+    redis_client = get_redis()
+    if redis_client is None:
+        return None
+
+    try:
+        raw = redis_client.get(REDIS_PREFIX + date_key)
+    except Exception as e:
+        logging.warning(f"Menu cache: Redis read failed: {e}")
+        return None
+    if raw is None:
+        return None
+
+    cached = json.loads(raw)
+    _store_local(date_key, cached['payload'], cached['etag'])
+    return cached['payload'], cached['etag']
+
+
+def put(date_key, payload):
+    """Cache a serialized menu in both tiers and return its ETag."""
+    etag = make_etag(payload)
+    _store_local(date_key, payload, etag)
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.set(REDIS_PREFIX + date_key,
+                             json.dumps({'payload': payload, 'etag': etag}),
+                             ex=_settings()[2])
+        except Exception as e:
+            logging.warning(f"Menu cache: Redis write failed: {e}")
+    return etag
+
+
+def invalidate(*date_keys):
+    """Drop cached menus for the given dates from both tiers, on every worker."""
+    date_keys = [str(key) for key in date_keys]
+    if not date_keys:
+        return
+
+    _drop_local(date_keys)
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.delete(*[REDIS_PREFIX + key for key in date_keys])
+        except Exception as e:
+            logging.warning(f"Menu cache: Redis invalidation failed: {e}")
+
+    # Other workers drop their local copies too, instead of serving them until the TTL
+    events.publish(events.CACHE, 'menu.invalidated', {'dates': date_keys})
+
+
+def clear():
+    """Empty this worker's local tier."""
+    with _lock:
+        _local.clear()
+
+
+def _drop_local(date_keys):
+    with _lock:
+        for key in date_keys:
+            _local.pop(key, None)
+
+
+def _on_cache_event(event, data):
+    if event == 'menu.invalidated':
+        _drop_local(data['dates'])
+
+
+events.on(events.CACHE, _on_cache_event)
+
+
+def _store_local(date_key, payload, etag):
+    size, ttl, _ = _settings()
+    with _lock:
+        _local[date_key] = (time.monotonic() + ttl, payload, etag)
+        _local.move_to_end(date_key)
+        while len(_local) > size:
+            _local.popitem(last=False)
+
+
+def dates_for_meal(meal_id):
+    """Dates of every menu a meal appears on, as cache keys."""
+    rows = db.session.query(Menu.date)\
+        .join(menu_meals, menu_meals.c.menu_id == Menu.id)\
+        .filter(menu_meals.c.meal_id == meal_id).all()
+    return [str(row.date) for row in rows]
@@ -0,0 +1,30 @@
+"""Add meal name trigram index
+
+Revision ID: 8d2b4e6f1c03
+Revises: 3c9e1f0a7b21
+Create Date: 2026-10-18 11:40:07.518332
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2b4e6f1c03'
+down_revision = '3c9e1f0a7b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only Postgres has pg_trgm; other databases use the in-process index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_meals_name_trgm ON meals USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_meals_name_trgm')
@@ -2,13 +2,18 @@ from datetime import datetime, timedelta, date
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db  # Import db from extensions.py
 from flask_jwt_extended import create_access_token
-from sqlalchemy import DateTime, Column, Date  # Add Date here
+from sqlalchemy import DateTime, Column, Date, event  # Add Date here
+from sqlalchemy.orm import Session, object_session
+import logging
+import events
 
 # Association table for many-to-many relationship between Menu and Meal
 menu_meals = db.Table(
     'menu_meals',
     db.Column('menu_id', db.Integer, db.ForeignKey('menus.id', ondelete="CASCADE"), primary_key=True),
-    db.Column('meal_id', db.Integer, db.ForeignKey('meals.id', ondelete="CASCADE"), primary_key=True)
+    db.Column('meal_id', db.Integer, db.ForeignKey('meals.id', ondelete="CASCADE"), primary_key=True),
+    db.Column('capacity', db.Integer, nullable=True),  # Portions the kitchen cooks; NULL is unlimited
+    db.Column('remaining', db.Integer, nullable=True)  # Portions left to sell, reserved atomically
 )
 
 class User(db.Model):
@@ -25,6 +30,12 @@ class User(db.Model):
     google_id = db.Column(db.String(100), unique=True, nullable=True)
     github_id = db.Column(db.String(100), unique=True, nullable=True)
     facebook_id = db.Column(db.String(100), unique=True, nullable=True)
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Personal, kept in step with is_read
+    # Newest broadcast this user has seen; new users start at the latest one
+    last_seen_broadcast_id = db.Column(
+        db.Integer, nullable=False, server_default='0',
+        default=db.text('(SELECT COALESCE(MAX(id), 0) FROM broadcasts)')
+    )
 
     meals = db.relationship('Meal', back_populates='caterer', lazy=True, cascade="all, delete-orphan")
     orders = db.relationship('Order', back_populates='user', cascade="all, delete-orphan")
@@ -60,6 +71,9 @@ class Meal(db.Model):
     caterer = db.relationship('User', back_populates='meals')
     menus = db.relationship('Menu', secondary=menu_meals, back_populates='meals')
 
+    # Serves keyset pages of the catalog filtered by caterer
+    __table_args__ = (db.Index('ix_meals_caterer_id_id', 'caterer_id', 'id'),)
+
     def __repr__(self):
         return f'<Meal {self.name} - ${self.price}>'
 
@@ -90,9 +104,16 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     payment_status = db.Column(db.Boolean, default=False)  # Payment status
+    intake_id = db.Column(db.String(32), nullable=True, index=True)  # Set when placed through the intake queue
     user = db.relationship('User', back_populates='orders')
     meal = db.relationship('Meal', backref='orders')
 
+    # Keyset pages of order history, overall and per customer
+    __table_args__ = (
+        db.Index('ix_orders_date_id', 'date', 'id'),
+        db.Index('ix_orders_user_id_date_id', 'user_id', 'date', 'id'),
+    )
+
     def update_order(self, new_meal_id, new_quantity):
         """Allows the user to change their meal choice."""
         self.meal_id = new_meal_id
@@ -102,11 +123,9 @@ class Order(db.Model):
 
     @staticmethod
     def get_daily_revenue(date):
-        """Calculates total revenue for a specific day."""
-        total_revenue = db.session.query(db.func.sum(Order.total_price))\
-            .join(Menu, Order.menu_id == Menu.id)\
-            .filter(Menu.date == date).scalar()
-        return total_revenue or 0
+        """Returns total revenue for a specific day from the daily rollup."""
+        rollup = db.session.get(DailyRevenue, date)
+        return rollup.revenue if rollup else 0
 
     @property
     def customer_name(self):
@@ -129,6 +148,37 @@ class Order(db.Model):
                f"status={self.status}, total_price=${self.total_price}, date={self.formatted_date})>"
 
 
+class DailyRevenue(db.Model):
+    """Per-day revenue and order count, kept in step with order inserts."""
+    __tablename__ = 'daily_revenue'
+
+    day = db.Column(Date, primary_key=True)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DailyRevenue {self.day} - ${self.revenue} ({self.order_count} orders)>'
+
+
+class MealDailyStats(db.Model):
+    """Per-(day, meal) sales counters, kept in step with order inserts."""
+    __tablename__ = 'meal_daily_stats'
+
+    day = db.Column(Date, primary_key=True)
+    meal_id = db.Column(db.Integer, db.ForeignKey('meals.id', ondelete="CASCADE"), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Per-meal time series across days
+    __table_args__ = (db.Index('ix_meal_daily_stats_meal_id_day', 'meal_id', 'day'),)
+
+    def __repr__(self):
+        return f'<MealDailyStats {self.day} meal={self.meal_id} qty={self.quantity}>'
+
+
 class Notification(db.Model):
     __tablename__ = 'notifications'
 
@@ -136,25 +186,96 @@ class Notification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
     message = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    is_read = db.Column(db.Boolean, default=False)
+    is_read = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # NOT NULL so unread filters are '= false', which the index serves
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', back_populates='notifications')
 
+    # A user's unread notifications, newest first, straight from the index; retention sweeps by age
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_is_read_timestamp', 'user_id', 'is_read', 'timestamp'),
+        db.Index('ix_notifications_timestamp', 'timestamp'),
+    )
+
     def mark_as_read(self):
         """Mark the notification as read."""
-        self.is_read = True
+        if not self.is_read:
+            self.is_read = True
+            db.session.execute(
+                db.update(User.__table__).where(User.id == self.user_id, User.unread_notifications > 0)
+                .values(unread_notifications=User.unread_notifications - 1)
+            )
         db.session.commit()
 
     def __repr__(self):
         return f'<Notification {self.id} - {self.message}>'
 
+
+def _queue_notification_events(session, rows):
+    """Push (id, user_id, message, timestamp) rows to their users' event streams once session commits."""
+    session.info.setdefault('notification_events', []).extend(rows)
+
+
+@event.listens_for(Notification, 'after_insert')
+def _notification_inserted(mapper, connection, target):
+    """Any ORM insert keeps the unread counter in step, in the same transaction."""
+    if not target.is_read:
+        connection.execute(
+            db.update(User.__table__).where(User.id == target.user_id)
+            .values(unread_notifications=User.unread_notifications + 1)
+        )
+    _queue_notification_events(object_session(target),
+                              [(target.id, target.user_id, target.message, target.timestamp)])
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_notification_events(session):
+    for notification_id, user_id, message, timestamp in session.info.pop('notification_events', ()):
+        try:
+            events.publish(events.user_channel(user_id), 'notification', {
+                'id': notification_id,
+                'type': 'personal',
+                'message': message,
+                'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S') if timestamp else None
+            })
+        except Exception as e:
+            logging.warning(f"Notifications: could not publish notification {notification_id}: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_notification_events(session):
+    session.info.pop('notification_events', None)
+
+class Broadcast(db.Model):
+    """One row per message sent to a whole audience; users read it via their last-seen cursor."""
+    __tablename__ = 'broadcasts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    message = db.Column(db.String(255), nullable=False)
+    audience = db.Column(db.String(20), nullable=False, default='customer')  # Role that receives it
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<Broadcast {self.id} - {self.message}>'
+
+class UserRevocation(db.Model):
+    """Every token a user was issued up to revoked_at is revoked (role change or account deletion)."""
+    __tablename__ = 'user_revocations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)  # No foreign key: must outlive a deleted user
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<UserRevocation user={self.user_id} at {self.revoked_at}>'
+
+
 class TokenBlocklist(db.Model):
     __tablename__ = 'token_blocklist'
 
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, unique=True, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     def __repr__(self):
         return f'<TokenBlocklist {self.jti}>'
\ No newline at end of file
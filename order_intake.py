@@ -0,0 +1,377 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from celery import Celery
+from flask import current_app
+from sqlalchemy import insert
+from extensions import db, get_redis
+from models import Order
+import capacity
+import events
+import rollups
+
+# Intake statuses
+QUEUED = 'queued'
+PERSISTED = 'persisted'
+FAILED = 'failed'
+
+STATUS_PREFIX = 'order-intake:'
+
+# What the kitchen feed and the customer see of a new order
+ANNOUNCED_COLUMNS = (Order.id, Order.user_id, Order.menu_id, Order.meal_id, Order.quantity,
+                     Order.total_price, Order.status, Order.updated_at, Order.intake_id)
+
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+# Baskets whose request waits for the Celery handover: {intake id: _Handover}
+_handovers = {}
+_handovers_lock = threading.Lock()
+
+# Recent intake statuses for this worker: {intake id: {'status', 'user_id', 'error'}}
+_statuses = OrderedDict()
+_statuses_lock = threading.Lock()
+_MAX_STATUSES = 10000
+
+# Only used when ORDER_INTAKE_BACKEND=celery; run the worker with `celery -A order_intake worker`
+celery = Celery('order_intake', broker=os.getenv('CELERY_BROKER_URL') or os.getenv('REDIS_URL'))
+
+
+class IntakeUnavailable(Exception):
+    """Raised by submit() when a basket could not be handed to the broker."""
+
+
+class _Handover:
+    """A request waiting until its basket is in the broker: waiting -> claimed -> done, or abandoned."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.state = 'waiting'
+        self.ok = False
+
+
+def check_config(config):
+    """
+    Refuse to start with a queued intake that could lose baskets or their statuses:
+    statuses are shared through Redis, and outside tests baskets go through Celery.
+    """
+    if config.get('ORDER_INTAKE_MODE') != 'queued':
+        return
+    if not config.get('REDIS_URL'):
+        raise ValueError("ORDER_INTAKE_MODE=queued needs REDIS_URL: intake statuses are shared through Redis.")
+    backend = config.get('ORDER_INTAKE_BACKEND')
+    if backend not in ('thread', 'celery'):
+        raise ValueError(f"ORDER_INTAKE_BACKEND must be 'thread' or 'celery', not {backend!r}.")
+    if backend == 'thread' and not config.get('TESTING'):
+        raise ValueError("ORDER_INTAKE_BACKEND=thread keeps accepted baskets in memory; use celery outside tests.")
+
+
+def write_orders(order_rows):
+    """
+    Reserve portions, insert priced order rows and update the rollups, without
+    committing. Raises capacity.SoldOut (caller rolls back) when portions run out.
+    Returns the new rows (ANNOUNCED_COLUMNS) for announce() once committed.
+    Shared by synchronous placement and the queued worker.
+    """
+    capacity.reserve(order_rows)
+    created = db.session.execute(
+        insert(Order.__table__).values(order_rows).returning(*ANNOUNCED_COLUMNS)
+    ).all()
+    rollups.record_orders(order_rows)
+    return created
+
+
+def announce(created):
+    """Publish committed orders: all of them to the kitchen, each customer their own."""
+    orders = [{
+        'id': row.id,
+        'user_id': row.user_id,
+        'menu_id': row.menu_id,
+        'meal_id': row.meal_id,
+        'quantity': row.quantity,
+        'total_price': row.total_price,
+        'status': row.status,
+        'updated_at': row.updated_at.isoformat(),
+        'intake_id': row.intake_id
+    } for row in created]
+    if not orders:
+        return
+
+    events.publish(events.KITCHEN, 'order.created', {'orders': orders})
+    by_user = {}
+    for order in orders:
+        by_user.setdefault(order['user_id'], []).append(order)
+    for user_id, own in by_user.items():
+        events.publish(events.user_channel(user_id), 'order.created', {'orders': own})
+
+
+def submit(user_id, order_rows):
+    """
+    Queue a validated basket for a group commit and return its intake id. With the
+    Celery backend this returns once the basket's batch is in the broker, so an
+    acknowledged basket survives this process; raises IntakeUnavailable otherwise.
+    """
+    app = current_app._get_current_object()
+    intake_id = uuid.uuid4().hex
+    for row in order_rows:
+        row['intake_id'] = intake_id
+
+    handover = None
+    if app.config.get('ORDER_INTAKE_BACKEND') == 'celery':
+        handover = _Handover()
+        with _handovers_lock:
+            _handovers[intake_id] = handover
+
+    _set_status(intake_id, {'status': QUEUED, 'user_id': user_id})
+    _queue.put((intake_id, user_id, order_rows))
+    _ensure_worker(app)
+    if handover is None:
+        return intake_id
+
+    handover.event.wait(app.config.get('ORDER_INTAKE_HANDOVER_SECONDS', 5))
+    with _handovers_lock:
+        if handover.state == 'waiting':
+            # Not picked up in time: the worker will skip it, so the client may safely retry
+            handover.state = 'abandoned'
+        else:
+            _handovers.pop(intake_id, None)
+    if handover.state == 'abandoned':
+        _set_status(intake_id, {'status': FAILED, 'user_id': user_id, 'error': 'Order could not be queued'})
+        raise IntakeUnavailable(intake_id)
+    if handover.state == 'done' and not handover.ok:
+        raise IntakeUnavailable(intake_id)
+    # Still 'claimed' (the broker is slow): the outcome lands in the intake status
+    return intake_id
+
+
+def status(intake_id):
+    """Latest known status for an intake id, or None if it was never seen."""
+    with _statuses_lock:
+        known = _statuses.get(intake_id)
+    # Final states are only ever set here; a queued basket may have been written elsewhere (Celery)
+    if known and known['status'] != QUEUED:
+        return dict(known)
+
+    # Every worker (and the Celery workers) record statuses in Redis, so any of them can answer
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            raw = redis_client.get(STATUS_PREFIX + intake_id)
+            if raw:
+                known = json.loads(raw)
+                if known['status'] != QUEUED:
+                    return known
+        except Exception as e:
+            logging.warning(f"Order intake: Redis status read failed: {e}")
+
+    # The orders table is the source of truth once a basket is written
+    row = db.session.query(Order.user_id).filter(Order.intake_id == intake_id).first()
+    if row:
+        return {'status': PERSISTED, 'user_id': row.user_id}
+    return dict(known) if known else None
+
+
+def drain(timeout=10):
+    """
+    Persist everything still queued in this process, then wait for the batch the
+    worker already took off the queue (used at shutdown).
+    """
+    batch = []
+    while True:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if batch and _worker is not None:
+        try:
+            _flush(_worker.app, batch)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+    deadline = time.monotonic() + timeout
+    with _queue.all_tasks_done:
+        while _queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.error(f"Order intake: {_queue.unfinished_tasks} basket(s) still in flight at shutdown")
+                break
+            _queue.all_tasks_done.wait(remaining)
+
+
+def persist_batch(batch):
+    """
+    Write many baskets in one transaction. If that fails, fall back to one
+    transaction per basket so a single bad basket cannot sink the rest.
+    """
+    try:
+        created = write_orders([row for _, _, rows in batch for row in rows])
+        db.session.commit()
+        for intake_id, user_id, _ in batch:
+            _set_status(intake_id, {'status': PERSISTED, 'user_id': user_id})
+        announce(created)
+        return
+    except Exception as e:
+        db.session.rollback()
+        logging.warning(f"Order intake: group commit of {len(batch)} basket(s) failed, retrying singly: {e}")
+
+    for intake_id, user_id, rows in batch:
+        try:
+            created = write_orders(rows)
+            db.session.commit()
+            _set_status(intake_id, {'status': PERSISTED, 'user_id': user_id})
+            announce(created)
+        except capacity.SoldOut:
+            db.session.rollback()
+            _set_status(intake_id, {'status': FAILED, 'user_id': user_id, 'error': 'Not enough portions left'})
+            events.publish(events.user_channel(user_id), 'order.failed',
+                           {'intake_id': intake_id, 'error': 'Not enough portions left'})
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Order intake: basket {intake_id} failed: {e}")
+            _set_status(intake_id, {'status': FAILED, 'user_id': user_id, 'error': 'Order could not be saved'})
+            events.publish(events.user_channel(user_id), 'order.failed',
+                           {'intake_id': intake_id, 'error': 'Order could not be saved'})
+
+
+class _Worker(threading.Thread):
+    """Collects queued baskets and group-commits them (or hands batches to Celery)."""
+
+    def __init__(self, app):
+        super().__init__(name='order-intake', daemon=True)
+        self.app = app
+
+    def run(self):
+        while True:
+            batch = [_queue.get()]
+            batch_size = self.app.config.get('ORDER_INTAKE_BATCH_SIZE', 200)
+            deadline = time.monotonic() + self.app.config.get('ORDER_INTAKE_FLUSH_MS', 50) / 1000
+
+            # Gather until the batch is full or the flush window closes
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                _flush(self.app, batch)
+            except Exception as e:
+                logging.error(f"Order intake: flush failed: {e}")
+            finally:
+                # drain() waits on these, so a batch in flight is not cut off at shutdown
+                for _ in batch:
+                    _queue.task_done()
+
+
+def _flush(app, batch):
+    if app.config.get('ORDER_INTAKE_BACKEND') == 'celery':
+        _hand_over(app, batch)
+        return
+    with app.app_context():
+        persist_batch(batch)
+
+
+def _hand_over(app, batch):
+    """Send a batch to Celery and release the requests waiting on it."""
+    with _handovers_lock:
+        handovers = {intake_id: _handovers.get(intake_id) for intake_id, _, _ in batch}
+        # A request that gave up has already answered 503; its basket must not be written
+        batch = [item for item in batch if getattr(handovers[item[0]], 'state', None) != 'abandoned']
+        for intake_id, handover in list(handovers.items()):
+            if handover is not None and handover.state == 'abandoned':
+                _handovers.pop(intake_id, None)
+                del handovers[intake_id]
+            elif handover is not None:
+                handover.state = 'claimed'
+    if not batch:
+        return
+
+    try:
+        persist_orders.delay(_dump_batch(batch))
+        ok = True
+    except Exception as e:
+        ok = False
+        logging.error(f"Order intake: handing {len(batch)} basket(s) to Celery failed: {e}")
+        with app.app_context():
+            for intake_id, user_id, _ in batch:
+                _set_status(intake_id, {'status': FAILED, 'user_id': user_id, 'error': 'Order could not be queued'})
+
+    with _handovers_lock:
+        for handover in handovers.values():
+            if handover is not None:
+                handover.state = 'done'
+                handover.ok = ok
+                handover.event.set()
+
+
+def _ensure_worker(app):
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = _Worker(app)
+            _worker.start()
+
+
+def _set_status(intake_id, value):
+    with _statuses_lock:
+        _statuses[intake_id] = value
+        _statuses.move_to_end(intake_id)
+        while len(_statuses) > _MAX_STATUSES:
+            _statuses.popitem(last=False)
+
+    redis_client = get_redis()
+    if redis_client is not None:
+        try:
+            redis_client.set(STATUS_PREFIX + intake_id, json.dumps(value), ex=3600)
+        except Exception as e:
+            logging.warning(f"Order intake: Redis status write failed: {e}")
+
+
+# Celery transport: batches travel as JSON, so datetimes go over as ISO strings
+_DATETIME_FIELDS = ('date', 'created_at', 'updated_at')
+
+
+def _dump_batch(batch):
+    return [
+        [intake_id, user_id, [
+            {key: (value.isoformat() if key in _DATETIME_FIELDS else value) for key, value in row.items()}
+            for row in rows
+        ]]
+        for intake_id, user_id, rows in batch
+    ]
+
+
+def _load_batch(batch):
+    return [
+        (intake_id, user_id, [
+            {key: (datetime.fromisoformat(value) if key in _DATETIME_FIELDS else value) for key, value in row.items()}
+            for row in rows
+        ])
+        for intake_id, user_id, rows in batch
+    ]
+
+
+@celery.task(name='order_intake.persist_orders')
+def persist_orders(batch):
+    """Celery task: group-commit a batch handed over by an API worker."""
+    from app import app
+    with app.app_context():
+        persist_batch(_load_batch(batch))
+
+
+atexit.register(drain)
@@ -0,0 +1,48 @@
+import base64
+import binascii
+from datetime import datetime
+from flask import request
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+def parse_limit(default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    """Read ?limit= from the request, clamped to [1, maximum]. Returns None if invalid."""
+    try:
+        limit = int(request.args.get('limit', default))
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(limit, maximum))
+
+
+def parse_int_arg(name):
+    """Read an optional integer query argument. Raises ValueError if malformed."""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    return int(value)
+
+
+def parse_float_arg(name):
+    """Read an optional float query argument. Raises ValueError if malformed."""
+    value = request.args.get(name)
+    if value in (None, ''):
+        return None
+    return float(value)
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor for keyset pages ordered by (timestamp, id)."""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError if the cursor is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise ValueError(f"Invalid cursor: {cursor}")
@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, false, select, true, update
+from extensions import db
+from models import User, Notification, Broadcast, TokenBlocklist, UserRevocation
+import revocation
+
+# Old rows are removed a bounded batch at a time: each DELETE picks its ids through
+# an index, commits, and lets other writers in before the next one.
+
+
+def _purge(table, condition, batch_size, pause, dry_run, recount_unread=False):
+    """Delete rows of table matching condition in id batches. Returns rows deleted (or that would be)."""
+    if dry_run:
+        return db.session.execute(select(db.func.count()).select_from(table).where(condition)).scalar()
+
+    deleted = 0
+    while True:
+        batch = select(table.c.id).where(condition).order_by(table.c.id).limit(batch_size)
+        if recount_unread:
+            rows = db.session.execute(batch.add_columns(table.c.user_id)).all()
+            count = db.session.execute(delete(table).where(table.c.id.in_([row.id for row in rows]))).rowcount
+            _recount_unread({row.user_id for row in rows})
+        else:
+            count = db.session.execute(delete(table).where(table.c.id.in_(batch.scalar_subquery()))).rowcount
+        db.session.commit()
+
+        deleted += count
+        if count < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def _recount_unread(user_ids):
+    """Unread notifications were deleted: recount those users' counters from the index."""
+    if not user_ids:
+        return
+    unread = select(db.func.count()).select_from(Notification.__table__)\
+        .where(Notification.user_id == User.id, Notification.is_read == false())\
+        .scalar_subquery()
+    db.session.execute(update(User.__table__).where(User.id.in_(user_ids)).values(unread_notifications=unread))
+
+
+def purge_expired(dry_run=False, batch_size=None, now=None):
+    """
+    Delete what has outlived its retention window. Returns {table: rows}.
+    Windows come from config; a window of 0 days keeps that kind of row forever.
+    """
+    config = current_app.config
+    batch_size = batch_size or config.get('RETENTION_BATCH_SIZE', 5000)
+    pause = config.get('RETENTION_BATCH_PAUSE_MS', 50) / 1000
+    now = now or datetime.utcnow()
+    results = {}
+
+    read_days = config.get('RETENTION_READ_NOTIFICATION_DAYS', 30)
+    if read_days:
+        results['notifications (read)'] = _purge(
+            Notification.__table__,
+            (Notification.timestamp < now - timedelta(days=read_days)) & (Notification.is_read == true()),
+            batch_size, pause, dry_run
+        )
+
+    unread_days = config.get('RETENTION_UNREAD_NOTIFICATION_DAYS', 180)
+    if unread_days:
+        results['notifications (unread)'] = _purge(
+            Notification.__table__,
+            (Notification.timestamp < now - timedelta(days=unread_days)) & (Notification.is_read == false()),
+            batch_size, pause, dry_run, recount_unread=True
+        )
+
+    broadcast_days = config.get('RETENTION_BROADCAST_DAYS', 30)
+    if broadcast_days:
+        results['broadcasts'] = _purge(
+            Broadcast.__table__,
+            Broadcast.created_at < now - timedelta(days=broadcast_days),
+            batch_size, pause, dry_run
+        )
+
+    # A revoked token is harmless once it would have expired anyway: refresh tokens live longest
+    lifetime = revocation.token_lifetime(config)
+    if lifetime:  # None means some tokens never expire, so revocations must be kept
+        grace = timedelta(seconds=config.get('RETENTION_BLOCKLIST_GRACE_SECONDS', 3600))
+        results['token_blocklist'] = _purge(
+            TokenBlocklist.__table__,
+            TokenBlocklist.created_at < now - lifetime - grace,
+            batch_size, pause, dry_run
+        )
+        results['user_revocations'] = _purge(
+            UserRevocation.__table__,
+            UserRevocation.revoked_at < now - lifetime - grace,
+            batch_size, pause, dry_run
+        )
+    return results
+
+
+@click.command('purge-expired')
+@click.option('--dry-run', is_flag=True, help='Only count what would be deleted.')
+@click.option('--batch-size', type=int, help='Rows per DELETE (default RETENTION_BATCH_SIZE).')
+@with_appcontext
+def purge_expired_command(dry_run, batch_size):
+    """Delete old notifications, broadcasts and expired token revocations in batches."""
+    results = purge_expired(dry_run=dry_run, batch_size=batch_size)
+    verb = 'Would delete' if dry_run else 'Deleted'
+    for table, rows in results.items():
+        click.echo(f"{verb} {rows} row(s) from {table}.")
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from auth_context import ISSUED_CLAIM
+from extensions import db
+from models import UserRevocation, TokenBlocklist
+
+# Revoked JTIs that could still be presented, mirrored from token_blocklist: {jti: revoked_at}.
+# Checking a token is a set lookup; the table is re-read incrementally at most every
+# REVOCATION_REFRESH_SECONDS, so a logout on one worker reaches the others within that window.
+_revoked = {}
+# Users whose every earlier token is revoked, mirrored from user_revocations: {user_id: latest revoked_at}
+_revoked_users = {}
+_lock = threading.Lock()
+_state = {'refreshed_at': None, 'watermark': None}
+
+
+def is_revoked(jwt_header, jwt_payload):
+    """
+    token_in_blocklist_loader callback: no I/O unless this worker's copy is due a refresh.
+    A token is revoked by its jti, or by being issued (iat) before its user's latest revocation.
+    """
+    refreshed_at = _state['refreshed_at']
+    if refreshed_at is None or time.monotonic() - refreshed_at >= current_app.config.get('REVOCATION_REFRESH_SECONDS', 5):
+        try:
+            refresh()
+        except Exception as e:
+            # Keep serving from the last good copy rather than failing every request
+            logging.warning(f"Revocation: refresh failed, using cached list: {e}")
+    if jwt_payload['jti'] in _revoked:
+        return True
+    revoked_at = _revoked_users.get(jwt_payload.get('uid'))
+    if revoked_at is None:
+        return False
+    issued_ms = jwt_payload.get(ISSUED_CLAIM)
+    if issued_ms is not None:
+        return issued_ms <= _timestamp(revoked_at) * 1000
+    # Only whole-second iat: a token from the same second as the revocation may predate it
+    return jwt_payload['iat'] <= int(_timestamp(revoked_at))
+
+
+def revoke(jti, revoked_at):
+    """Record a revocation made by this worker so it applies here immediately."""
+    with _lock:
+        _revoked[jti] = revoked_at
+
+
+def revoke_user(user_id, revoked_at):
+    """Record that every token issued to a user before revoked_at is revoked, on this worker."""
+    with _lock:
+        _revoke_user(user_id, revoked_at)
+
+
+def refresh():
+    """Pull revocations newer than the watermark and forget those whose tokens have expired."""
+    config = current_app.config
+    now = datetime.utcnow()
+    # Older revocations can no longer match a valid token
+    lifetime = token_lifetime(config)
+    horizon = now - lifetime if lifetime else datetime.min
+
+    # Re-read a little behind the watermark: transactions can commit out of created_at order
+    since = horizon if _state['watermark'] is None else \
+        max(horizon, _state['watermark'] - timedelta(seconds=config.get('REVOCATION_OVERLAP_SECONDS', 60)))
+    rows = db.session.query(TokenBlocklist.jti, TokenBlocklist.created_at)\
+        .filter(TokenBlocklist.created_at >= since).all()
+    users = db.session.query(UserRevocation.user_id, UserRevocation.revoked_at)\
+        .filter(UserRevocation.revoked_at >= since).all()
+
+    with _lock:
+        for jti, created_at in rows:
+            _revoked[jti] = created_at
+        for user_id, revoked_at in users:
+            _revoke_user(user_id, revoked_at)
+        for revoked_at in [created_at for _, created_at in rows] + [revoked_at for _, revoked_at in users]:
+            if _state['watermark'] is None or revoked_at > _state['watermark']:
+                _state['watermark'] = revoked_at
+        for jti in [jti for jti, created_at in _revoked.items() if created_at < horizon]:
+            del _revoked[jti]
+        for user_id in [user_id for user_id, revoked_at in _revoked_users.items() if revoked_at < horizon]:
+            del _revoked_users[user_id]
+        if _state['watermark'] is None:
+            _state['watermark'] = now
+        _state['refreshed_at'] = time.monotonic()
+
+
+def _revoke_user(user_id, revoked_at):
+    # Only the latest revocation matters; callers hold _lock
+    if user_id not in _revoked_users or revoked_at > _revoked_users[user_id]:
+        _revoked_users[user_id] = revoked_at
+
+
+def clear():
+    with _lock:
+        _revoked.clear()
+        _revoked_users.clear()
+        _state.update(refreshed_at=None, watermark=None)
+
+
+def token_lifetime(config):
+    """Longest any token lives (a timedelta), or None when some tokens never expire."""
+    lifetimes = [config.get('JWT_ACCESS_TOKEN_EXPIRES'), config.get('JWT_REFRESH_TOKEN_EXPIRES')]
+    if not all(lifetimes):
+        return None
+    return max(lifetime if isinstance(lifetime, timedelta) else timedelta(seconds=lifetime) for lifetime in lifetimes)
+
+
+def _timestamp(naive_utc):
+    """Seconds since the epoch (with the fraction) for a naive UTC datetime."""
+    return naive_utc.replace(tzinfo=timezone.utc).timestamp()
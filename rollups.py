@@ -0,0 +1,205 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Order, DailyRevenue, MealDailyStats
+
+
+def _upsert(model, rows, key_columns, increment_columns):
+    """INSERT rows, adding to the existing counters on key conflict (one statement)."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql.insert
+    elif dialect == 'sqlite':
+        insert = sqlite.insert
+    else:
+        _upsert_portable(model, rows, key_columns, increment_columns)
+        return
+
+    table = model.__table__
+    statement = insert(table).values(rows)
+    set_ = {column: table.c[column] + statement.excluded[column] for column in increment_columns}
+    set_['updated_at'] = datetime.utcnow()
+    db.session.execute(statement.on_conflict_do_update(index_elements=key_columns, set_=set_))
+
+
+def _upsert_portable(model, rows, key_columns, increment_columns):
+    """
+    Same result without ON CONFLICT, for other databases: per row, an UPDATE, then an
+    INSERT if no row matched. A concurrent insert of the same key loses the race at the
+    unique constraint, inside a savepoint, and falls back to the UPDATE.
+    """
+    table = model.__table__
+    for row in rows:
+        key = [table.c[column] == row[column] for column in key_columns]
+        values = {column: table.c[column] + row[column] for column in increment_columns}
+        values['updated_at'] = row.get('updated_at') or datetime.utcnow()
+        update_row = update(table).where(*key).values(values)
+
+        if db.session.execute(update_row).rowcount:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(row))
+        except IntegrityError:
+            db.session.execute(update_row)
+
+
+def record_orders(order_rows):
+    """
+    Fold freshly inserted orders into the daily revenue and per-meal rollups.
+    Call inside the transaction that inserts the orders, before commit.
+    """
+    per_day = defaultdict(lambda: {'revenue': 0.0, 'order_count': 0})
+    per_meal = defaultdict(lambda: {'quantity': 0, 'revenue': 0.0, 'order_count': 0})
+    for row in order_rows:
+        day = row['date'].date()
+        totals = per_day[day]
+        totals['revenue'] += row['total_price']
+        totals['order_count'] += 1
+
+        if row.get('meal_id') is not None:
+            meal_totals = per_meal[(day, row['meal_id'])]
+            meal_totals['quantity'] += row['quantity']
+            meal_totals['revenue'] += row['total_price']
+            meal_totals['order_count'] += 1
+
+    now = datetime.utcnow()
+    if per_day:
+        _upsert(DailyRevenue, [
+            {'day': day, 'revenue': totals['revenue'], 'order_count': totals['order_count'], 'updated_at': now}
+            for day, totals in per_day.items()
+        ], ['day'], ['revenue', 'order_count'])
+
+    if per_meal:
+        _upsert(MealDailyStats, [
+            {'day': day, 'meal_id': meal_id, 'updated_at': now, **totals}
+            for (day, meal_id), totals in per_meal.items()
+        ], ['day', 'meal_id'], ['quantity', 'revenue', 'order_count'])
+
+
+def delete_orders(*criteria):
+    """
+    Delete the orders matching criteria and take them back out of both rollups, so the
+    rollups keep agreeing with the orders table. Three statements whatever the number
+    of orders; call inside the deleting transaction, before commit.
+    """
+    order_day = db.func.date(Order.date)
+    now = datetime.utcnow()
+
+    revenue = DailyRevenue.__table__
+    same_day = [*criteria, order_day == revenue.c.day]
+    db.session.execute(
+        update(revenue)
+        .where(revenue.c.day.in_(select(order_day).where(*criteria)))
+        .values(
+            revenue=revenue.c.revenue - select(db.func.coalesce(db.func.sum(Order.total_price), 0))
+            .where(*same_day).scalar_subquery(),
+            order_count=revenue.c.order_count - select(db.func.count(Order.id)).where(*same_day).scalar_subquery(),
+            updated_at=now
+        )
+    )
+
+    stats = MealDailyStats.__table__
+    same_row = [*criteria, order_day == stats.c.day, Order.meal_id == stats.c.meal_id]
+    db.session.execute(
+        update(stats)
+        .where(select(Order.id).where(*same_row).exists())
+        .values(
+            quantity=stats.c.quantity - select(db.func.coalesce(db.func.sum(Order.quantity), 0))
+            .where(*same_row).scalar_subquery(),
+            revenue=stats.c.revenue - select(db.func.coalesce(db.func.sum(Order.total_price), 0))
+            .where(*same_row).scalar_subquery(),
+            order_count=stats.c.order_count - select(db.func.count(Order.id)).where(*same_row).scalar_subquery(),
+            updated_at=now
+        )
+    )
+
+    db.session.execute(delete(Order.__table__).where(*criteria))
+
+
+def forget_meals(meal_ids):
+    """
+    Before deleting meals (ids, or a select of them): delete their orders through
+    delete_orders and drop their per-meal rows, on every database (not only where
+    the foreign key cascades). Does not commit.
+    """
+    delete_orders(Order.meal_id.in_(meal_ids))
+    db.session.execute(delete(MealDailyStats.__table__).where(MealDailyStats.meal_id.in_(meal_ids)))
+
+
+def backfill_revenue(start=None, end=None):
+    """Rebuild the rollup from orders for [start, end] (dates, both optional). Returns days written."""
+    order_day = db.func.date(Order.date)
+    orders = db.session.query(
+        order_day, db.func.coalesce(db.func.sum(Order.total_price), 0), db.func.count(Order.id), db.func.now()
+    )
+    rollups = DailyRevenue.query
+    if start:
+        orders = orders.filter(Order.date >= datetime.combine(start, datetime.min.time()))
+        rollups = rollups.filter(DailyRevenue.day >= start)
+    if end:
+        orders = orders.filter(Order.date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        rollups = rollups.filter(DailyRevenue.day <= end)
+
+    rollups.delete(synchronize_session=False)
+    result = db.session.execute(
+        DailyRevenue.__table__.insert().from_select(
+            ['day', 'revenue', 'order_count', 'updated_at'], orders.group_by(order_day)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def backfill_meal_stats(start=None, end=None):
+    """Rebuild the per-(day, meal) counters from orders for [start, end]. Returns rows written."""
+    order_day = db.func.date(Order.date)
+    orders = db.session.query(
+        order_day, Order.meal_id,
+        db.func.coalesce(db.func.sum(Order.quantity), 0),
+        db.func.coalesce(db.func.sum(Order.total_price), 0),
+        db.func.count(Order.id), db.func.now()
+    ).filter(Order.meal_id.isnot(None))
+    stats = MealDailyStats.query
+    if start:
+        orders = orders.filter(Order.date >= datetime.combine(start, datetime.min.time()))
+        stats = stats.filter(MealDailyStats.day >= start)
+    if end:
+        orders = orders.filter(Order.date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        stats = stats.filter(MealDailyStats.day <= end)
+
+    stats.delete(synchronize_session=False)
+    result = db.session.execute(
+        MealDailyStats.__table__.insert().from_select(
+            ['day', 'meal_id', 'quantity', 'revenue', 'order_count', 'updated_at'],
+            orders.group_by(order_day, Order.meal_id)
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@click.command('backfill-revenue')
+@click.option('--from', 'start', type=click.DateTime(formats=['%Y-%m-%d']), help='First day (YYYY-MM-DD).')
+@click.option('--to', 'end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day (YYYY-MM-DD).')
+@with_appcontext
+def backfill_revenue_command(start, end):
+    """Rebuild the daily revenue rollup from the orders table."""
+    days = backfill_revenue(start.date() if start else None, end.date() if end else None)
+    click.echo(f"Daily revenue rebuilt for {days} day(s).")
+
+
+@click.command('backfill-meal-stats')
+@click.option('--from', 'start', type=click.DateTime(formats=['%Y-%m-%d']), help='First day (YYYY-MM-DD).')
+@click.option('--to', 'end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day (YYYY-MM-DD).')
+@with_appcontext
+def backfill_meal_stats_command(start, end):
+    """Rebuild the per-(day, meal) analytics counters from the orders table."""
+    rows = backfill_meal_stats(start.date() if start else None, end.date() if end else None)
+    click.echo(f"Meal stats rebuilt: {rows} (day, meal) row(s).")
@@ -0,0 +1,230 @@
+import bisect
+import logging
+import math
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import text
+from extensions import db
+from models import Meal
+
+# Per-worker trigram index over Meal.name
+_meals = {}        # meal id -> (name, price, image_url)
+_grams = {}        # trigram -> set of meal ids
+_names = []        # sorted (lowercase name, meal id) for prefix lookups
+_built_at = None   # monotonic time of the last build, None until the first one
+_lock = threading.RLock()
+
+# Builds scan the meals table outside _lock and swap the result in. Changes made during
+# a build are queued in _pending and replayed on the new index: [(meal id, entry or None)]
+_pending = None
+_refreshing = False
+_build_lock = threading.Lock()
+
+
+def trigrams(value):
+    """Trigrams of each word, padded the way pg_trgm does it."""
+    grams = set()
+    for word in value.lower().split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def search(query, limit=10):
+    """Ranked matches for `query`: name prefixes first, then fuzzy trigram matches."""
+    if _use_pg_trgm():
+        return _search_pg_trgm(query, limit)
+
+    _ensure_built()
+    needle = query.strip().lower()
+    min_similarity = current_app.config.get('MEAL_SEARCH_MIN_SIMILARITY', 0.5)
+
+    with _lock:
+        scores = {}
+
+        # Prefix matches: a bisect into the sorted names, no scan
+        start = bisect.bisect_left(_names, (needle,))
+        for name, meal_id in _names[start:start + limit]:
+            if not name.startswith(needle):
+                break
+            scores[meal_id] = 2.0 if name == needle else 1.0 + len(needle) / len(name)
+
+        # Fuzzy matches (word similarity: share of the query's trigrams found in the name).
+        # A match needs `required` shared trigrams, so it must appear in one of the
+        # rarest len - required + 1 postings; common trigrams are only used to verify.
+        query_grams = sorted(trigrams(needle), key=lambda gram: len(_grams.get(gram, ())))
+        if query_grams:
+            required = max(1, math.ceil(min_similarity * len(query_grams)))
+            candidates = set()
+            for gram in query_grams[:len(query_grams) - required + 1]:
+                candidates.update(_grams.get(gram, ()))
+            candidates.difference_update(scores)
+
+            for meal_id in candidates:
+                common = sum(1 for gram in query_grams if meal_id in _grams.get(gram, ()))
+                similarity = common / len(query_grams)
+                if similarity >= min_similarity:
+                    scores[meal_id] = similarity
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], _meals[item[0]][0]))[:limit]
+        return [_result(meal_id, score) for meal_id, score in ranked]
+
+
+def upsert(meal):
+    """Index a new or renamed meal."""
+    with _lock:
+        if _built_at is None and _pending is None:
+            return  # Nothing to update, and reading a committed meal would reload it
+        _apply(meal.id, (meal.name, meal.price, meal.image_url))
+
+
+def remove(meal_id):
+    _apply(meal_id, None)
+
+
+def invalidate():
+    """Rebuild on the next search (e.g. after a bulk import); the current index serves until then."""
+    global _built_at
+    with _lock:
+        if _built_at is not None:
+            _built_at = -math.inf
+
+
+def clear():
+    """Forget the index entirely, e.g. when the database behind it was replaced."""
+    global _built_at
+    with _build_lock, _lock:
+        _meals.clear()
+        _grams.clear()
+        _names.clear()
+        _built_at = None
+
+
+def _apply(meal_id, entry):
+    with _lock:
+        if _pending is not None:
+            _pending.append((meal_id, entry))
+        if _built_at is not None:
+            _remove(meal_id)
+            if entry is not None:
+                _add(meal_id, *entry)
+
+
+def _ensure_built():
+    global _refreshing
+    ttl = current_app.config.get('MEAL_SEARCH_INDEX_TTL', 300)
+    with _lock:
+        if _built_at is not None:
+            # Stale: keep serving this index while a background thread builds the next one
+            if time.monotonic() - _built_at >= ttl and not _refreshing:
+                _refreshing = True
+                threading.Thread(target=_refresh, args=(current_app._get_current_object(),),
+                                 name='meal-search-index', daemon=True).start()
+            return
+
+    # Nothing to serve yet: build now, and concurrent first searches wait for this build
+    with _build_lock:
+        if _built_at is None:
+            _build()
+
+
+def _refresh(app):
+    global _refreshing
+    try:
+        with app.app_context(), _build_lock:
+            _build()
+    except Exception as e:
+        logging.warning(f"Meal search: index rebuild failed, serving the previous one: {e}")
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def _build():
+    """Full scan into a new index, then swap it in. Call with _build_lock held."""
+    global _meals, _grams, _names, _built_at, _pending
+    with _lock:
+        _pending = []
+
+    meals, grams, names = {}, {}, []
+    try:
+        rows = db.session.query(Meal.id, Meal.name, Meal.price, Meal.image_url)\
+            .execution_options(yield_per=5000)
+        for meal_id, name, price, image_url in rows:
+            meals[meal_id] = (name, price, image_url)
+            for gram in trigrams(name):
+                grams.setdefault(gram, set()).add(meal_id)
+            names.append((name.lower(), meal_id))
+        names.sort()
+    except Exception:
+        with _lock:
+            _pending = None
+        raise
+
+    with _lock:
+        _meals, _grams, _names = meals, grams, names
+        for meal_id, entry in _pending:
+            _remove(meal_id)
+            if entry is not None:
+                _add(meal_id, *entry)
+        _pending = None
+        _built_at = time.monotonic()
+
+
+def _add(meal_id, name, price, image_url):
+    _meals[meal_id] = (name, price, image_url)
+    _index_name(meal_id, name)
+    bisect.insort(_names, (name.lower(), meal_id))
+
+
+def _index_name(meal_id, name):
+    for gram in trigrams(name):
+        _grams.setdefault(gram, set()).add(meal_id)
+
+
+def _remove(meal_id):
+    entry = _meals.pop(meal_id, None)
+    if entry is None:
+        return
+    name = entry[0]
+    for gram in trigrams(name):
+        ids = _grams.get(gram)
+        if ids:
+            ids.discard(meal_id)
+            if not ids:
+                del _grams[gram]
+    index = bisect.bisect_left(_names, (name.lower(), meal_id))
+    if index < len(_names) and _names[index] == (name.lower(), meal_id):
+        del _names[index]
+
+
+def _result(meal_id, score):
+    name, price, image_url = _meals[meal_id]
+    return {'id': meal_id, 'name': name, 'price': price, 'image_url': image_url, 'score': round(score, 3)}
+
+
+def _use_pg_trgm():
+    return current_app.config.get('MEAL_SEARCH_BACKEND') == 'pg_trgm' \
+        and db.engine.dialect.name == 'postgresql'
+
+
+def _search_pg_trgm(query, limit):
+    """Same ranking, served by the GIN trigram index on meals.name."""
+    needle = query.strip()
+    prefix = needle.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    rows = db.session.execute(text("""
+        SELECT id, name, price, image_url,
+               CASE WHEN name ILIKE :prefix THEN 1 ELSE 0 END AS is_prefix,
+               word_similarity(:needle, name) AS score
+        FROM meals
+        WHERE name ILIKE :prefix OR :needle <% name
+        ORDER BY is_prefix DESC, score DESC, name
+        LIMIT :limit
+    """), {'prefix': prefix, 'needle': needle, 'limit': limit})
+    return [
+        {'id': row.id, 'name': row.name, 'price': row.price, 'image_url': row.image_url,
+         'score': round(float(row.score) + row.is_prefix, 3)}
+        for row in rows
+    ]
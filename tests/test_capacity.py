@@ -0,0 +1,187 @@
+"""
+Portion limits: capacity.reserve must never sell more than a menu has, however
+many baskets race for the last portions, and a basket it cannot serve gets a 409.
+
+Run with `python -m pytest`.
+"""
+import threading
+from datetime import date
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from sqlalchemy import select
+
+from extensions import db
+from models import User, Meal, Menu, Order, menu_meals
+import auth_context
+import availability
+import capacity
+import revocation
+
+CUSTOMER = 'customer@example.com'
+CATERER = 'caterer@example.com'
+OTHER_CATERER = 'other@example.com'
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Orders and menus on a file SQLite database, so threads share it."""
+    from Views.menu import menu_bp
+    from Views.order import order_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'capacity.db'}",
+        SQLALCHEMY_ENGINE_OPTIONS={'connect_args': {'timeout': 30}},
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        JWT_SECRET_KEY='capacity-secret-key-for-local-checks-only',
+        REVOCATION_REFRESH_SECONDS=10 ** 6,
+    )
+    db.init_app(app)
+    JWTManager(app).token_in_blocklist_loader(revocation.is_revoked)
+    app.register_blueprint(menu_bp)
+    app.register_blueprint(order_bp)
+
+    with app.app_context():
+        db.create_all()
+        customer = User(email=CUSTOMER, username='customer', role='customer')
+        caterer = User(email=CATERER, username='caterer', role='caterer')
+        other = User(email=OTHER_CATERER, username='other', role='caterer')
+        db.session.add_all([customer, caterer, other])
+        db.session.flush()
+
+        meals = [Meal(name='Pilau', price=5.0, caterer_id=caterer.id),
+                 Meal(name='Chapati', price=1.0, caterer_id=other.id)]
+        menu = Menu(date=date.today(), meals=meals)
+        db.session.add(menu)
+        db.session.flush()
+        capacity.set_capacities(menu.id, {meals[0].id: 10, meals[1].id: 3})
+        db.session.commit()
+
+    availability.clear()
+    auth_context.clear()
+    revocation.clear()
+    yield app
+    availability.clear()
+
+
+def _ids(app):
+    with app.app_context():
+        menu = Menu.query.one()
+        pilau = Meal.query.filter_by(name='Pilau').one()
+        chapati = Meal.query.filter_by(name='Chapati').one()
+        return menu.id, pilau.id, chapati.id
+
+
+def _remaining(app, menu_id, meal_id):
+    with app.app_context():
+        return db.session.execute(
+            select(menu_meals.c.remaining)
+            .where(menu_meals.c.menu_id == menu_id, menu_meals.c.meal_id == meal_id)
+        ).scalar_one()
+
+
+def _headers(app, email):
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=email)}'}
+
+
+def _basket(app, rows):
+    """Try to reserve one basket in its own transaction; True if it was served."""
+    with app.app_context():
+        try:
+            capacity.reserve(rows)
+        except capacity.SoldOut:
+            db.session.rollback()
+            return False
+        db.session.commit()
+        return True
+
+
+def test_reserve_stops_at_zero(app):
+    menu_id, pilau, _ = _ids(app)
+    served = []
+    for _ in range(8):
+        served.append(_basket(app, [{'menu_id': menu_id, 'meal_id': pilau, 'quantity': 3}]))
+        assert _remaining(app, menu_id, pilau) >= 0
+
+    # 10 portions: three baskets of 3, then the fourth finds only 1 left
+    assert served == [True, True, True] + [False] * 5
+    assert _remaining(app, menu_id, pilau) == 1
+    assert _basket(app, [{'menu_id': menu_id, 'meal_id': pilau, 'quantity': 1}])
+    assert _remaining(app, menu_id, pilau) == 0
+
+
+def test_short_basket_takes_nothing(app):
+    menu_id, pilau, chapati = _ids(app)
+    rows = [{'menu_id': menu_id, 'meal_id': pilau, 'quantity': 2},
+            {'menu_id': menu_id, 'meal_id': chapati, 'quantity': 2},
+            {'menu_id': menu_id, 'meal_id': chapati, 'quantity': 2}]
+
+    # Chapati has 3 left and the basket wants 4 in total: neither meal is touched
+    assert not _basket(app, rows)
+    assert _remaining(app, menu_id, pilau) == 10
+    assert _remaining(app, menu_id, chapati) == 3
+
+
+def test_concurrent_baskets_never_oversell(app):
+    menu_id, pilau, chapati = _ids(app)
+    baskets = 60
+    start = threading.Barrier(baskets)
+    results = []
+
+    def place(i):
+        # Every basket wants the contested chapati; some also want pilau
+        rows = [{'menu_id': menu_id, 'meal_id': chapati, 'quantity': 1}]
+        if i % 2:
+            rows.append({'menu_id': menu_id, 'meal_id': pilau, 'quantity': 1})
+        start.wait()
+        results.append(_basket(app, rows))
+
+    threads = [threading.Thread(target=place, args=(i,)) for i in range(baskets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 3
+    assert _remaining(app, menu_id, chapati) == 0
+    assert 10 - _remaining(app, menu_id, pilau) <= 3
+
+
+def test_losing_basket_gets_409(app):
+    menu_id, _, chapati = _ids(app)
+    client = app.test_client()
+    headers = _headers(app, CUSTOMER)
+
+    def order(quantity):
+        return client.post('/orders/add', headers=headers,
+                           json={'items': [{'menu_id': menu_id, 'meal_id': chapati, 'quantity': quantity}]})
+
+    assert order(2).status_code == 201
+    response = order(2)
+    assert response.status_code == 409
+    assert response.get_json()['items'] == [
+        {'menu_id': menu_id, 'meal_id': chapati, 'requested': 2, 'remaining': 1}
+    ]
+    assert order(1).status_code == 201
+    assert _remaining(app, menu_id, chapati) == 0
+    with app.app_context():
+        assert db.session.query(db.func.sum(Order.quantity)).scalar() == 3
+
+
+def test_caterer_sets_capacity_only_for_own_meals(app):
+    menu_id, pilau, chapati = _ids(app)
+    client = app.test_client()
+    headers = _headers(app, CATERER)
+    path = f'/menu/{date.today():%Y-%m-%d}/capacity'
+
+    response = client.put(path, headers=headers, json={'capacities': {str(chapati): 0}})
+    assert response.status_code == 403
+    assert _remaining(app, menu_id, chapati) == 3
+
+    response = client.put(path, headers=headers, json={'capacities': {str(pilau): 4}})
+    assert response.status_code == 200
+    assert _remaining(app, menu_id, pilau) == 4
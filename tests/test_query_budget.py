@@ -0,0 +1,319 @@
+"""
+Query-budget regression tests.
+
+Builds the app against in-memory SQLite, seeds it at two data sizes and calls every
+route once per size, counting SQL statements. A route fails when it answers with a
+status other than the one its case expects, runs more statements than its budget, or
+runs more statements on the large data set than on the small one (an N+1).
+
+Run with `python -m pytest`.
+"""
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import event
+
+from extensions import db, mail
+from models import User, Meal, Menu, Order, Notification
+import availability
+import instrumentation
+import auth_context
+import menu_cache
+import revocation
+import rollups
+import search_index
+
+SMALL = 3
+LARGE = 30
+
+# Maximum SQL statements per request, by endpoint. Tighten these as endpoints get cheaper;
+# raising one needs a reason in the commit message.
+BUDGETS = {
+    'auth_bp.login': 1,
+    'auth_bp.current_user': 1,
+    'auth_bp.refresh': 1,
+    'auth_bp.logout': 1,
+    'auth_bp.login_with_google': 1,
+
+    'user_bp.add_user': 3,
+    'user_bp.update_user': 4,
+    'user_bp.delete_user': 14,
+    'user_bp.password_reset': 1,
+    'user_bp.reset_password': 2,
+
+    'meal.add_meal': 2,
+    'meal.import_meals': 1,
+    'meal.update_meal': 4,
+    'meal.delete_meal': 10,
+    'meal.get_meals': 1,
+    'meal.search_meals': 1,
+
+    'menu.create_menu': 7,
+    'menu.get_menu': 2,
+    'menu.get_menus': 2,
+    'menu.select_meal': 2,
+    'menu.set_menu_capacity': 4,
+
+    'order_bp.add_order_route': 5,
+    'order_bp.get_orders': 1,
+    'order_bp.export_orders': 1,
+    'order_bp.get_revenue': 1,
+    'order_bp.get_revenue_range': 1,
+    'order_bp.get_order_history': 1,
+    'order_bp.get_admin_order_history': 1,
+    'order_bp.get_intake_status': 1,
+    'order_bp.update_order_status': 2,
+
+    'notifications.set_daily_menu': 2,
+    'notifications.mark_broadcasts_seen': 1,
+    'notifications.get_unread_count': 1,
+    'notifications.mark_notifications_read': 2,
+    'notifications.get_notifications': 2,
+
+    'admin_bp.add_meal': 3,
+    'admin_bp.modify_meal': 4,
+    'admin_bp.delete_meal': 10,
+    'admin_bp.setup_menu': 7,
+    'admin_bp.fetch_all_orders': 1,
+    'admin_bp.view_earnings': 1,
+    'admin_bp.view_earnings_breakdown': 1,
+
+    'analytics_bp.top_meals': 1,
+    'analytics_bp.caterer_breakdown': 1,
+    'analytics_bp.sales_series': 1,
+}
+
+ADMIN = 'admin@example.com'
+CATERER = 'caterer@example.com'
+CUSTOMER = 'customer1@example.com'
+LEAVING_CUSTOMER = 'customer2@example.com'  # Deletes their own account near the end
+
+INTAKE_ID = '0123456789abcdef'  # Set on the first customer's first order
+
+Case = namedtuple('Case', ['endpoint', 'method', 'path', 'identity', 'body', 'content_type', 'refresh', 'status'])
+
+
+def _case(endpoint, method, path, identity=None, body=None, content_type=None, refresh=False, status=200):
+    """One request; status is what a working route answers, so an error path can't pass for a cheap one."""
+    return Case(endpoint, method, path, identity, body, content_type, refresh, status)
+
+
+def _cases(today):
+    """Every route, in an order where mutating calls don't break later ones."""
+    day = today.strftime('%Y-%m-%d')
+    seeded_at = datetime.combine(today, datetime.min.time()).isoformat()  # updated_at of every seeded order
+    week_end = (today + timedelta(days=6)).strftime('%Y-%m-%d')
+    reset_token = URLSafeTimedSerializer('budget-secret').dumps(CUSTOMER, salt='password-reset')
+    return [
+        _case('auth_bp.login', 'POST', '/login', body={'email': CUSTOMER, 'password': 'password'}),
+        _case('auth_bp.login_with_google', 'POST', '/login_with_google', body={'email': CUSTOMER}),
+        _case('auth_bp.current_user', 'GET', '/current_user', CUSTOMER),
+        _case('auth_bp.refresh', 'POST', '/refresh', CUSTOMER, refresh=True),
+
+        _case('meal.get_meals', 'GET', '/meal/all?limit=50'),
+        _case('meal.search_meals', 'GET', '/meal/search?q=meal'),
+        _case('meal.add_meal', 'POST', '/meal/add', ADMIN, {'name': 'Extra', 'price': 3, 'image_url': 'x.png'},
+              status=201),
+        _case('meal.import_meals', 'POST', '/meal/import', ADMIN,
+              'name,price\nImported A,2\nImported B,3\n', 'text/csv', status=201),
+        _case('meal.update_meal', 'PUT', '/meal/update/1', ADMIN, {'price': 4}),
+
+        _case('menu.get_menu', 'GET', f'/menu/{day}', CUSTOMER),
+        _case('menu.get_menus', 'GET', f'/menus?from={day}&to={week_end}', CUSTOMER),
+        _case('menu.select_meal', 'POST', '/menu/select', CUSTOMER, {'date': day, 'meal_id': 2}),
+        _case('menu.create_menu', 'POST', '/menu', ADMIN,
+              {'date': (today + timedelta(days=30)).strftime('%Y-%m-%d'), 'meals': [1, 2]}, status=201),
+        _case('menu.set_menu_capacity', 'PUT', f'/menu/{day}/capacity', ADMIN, {'capacities': {'1': 1000}}),
+
+        _case('order_bp.add_order_route', 'POST', '/orders/add', CUSTOMER,
+              {'items': [{'menu_id': 1, 'meal_id': 1, 'quantity': 2}, {'menu_id': 1, 'meal_id': 2}]}, status=201),
+        _case('order_bp.get_orders', 'GET', '/orders/admin-history', ADMIN),
+        _case('order_bp.get_admin_order_history', 'GET', '/order-history', ADMIN),
+        _case('order_bp.export_orders', 'GET', '/orders/export?format=ndjson', ADMIN),
+        _case('order_bp.get_revenue', 'GET', f'/orders/revenue?date={day}', ADMIN),
+        _case('order_bp.get_revenue_range', 'GET', f'/orders/revenue/range?from={day}&to={week_end}', ADMIN),
+        _case('order_bp.get_order_history', 'GET', '/orders/history', CUSTOMER),
+        _case('order_bp.get_intake_status', 'GET', f'/orders/intake/{INTAKE_ID}', CUSTOMER),
+        _case('order_bp.update_order_status', 'PATCH', '/orders/status', ADMIN,
+              {'status': 'preparing', 'orders': [{'id': 1, 'updated_at': seeded_at}, {'id': 2, 'updated_at': seeded_at}]}),
+
+        _case('notifications.get_notifications', 'GET', '/notifications', CUSTOMER),
+        _case('notifications.set_daily_menu', 'POST', '/set_daily_menu', ADMIN, status=201),
+        _case('notifications.get_unread_count', 'GET', '/notifications/unread-count', CUSTOMER),
+        _case('notifications.mark_notifications_read', 'POST', '/notifications/read', CUSTOMER, {'all': True}),
+        _case('notifications.mark_broadcasts_seen', 'POST', '/notifications/broadcasts/seen', CUSTOMER),
+
+        _case('admin_bp.add_meal', 'POST', '/admin/meals', CATERER, {'name': 'Caterer Extra', 'price': 5, 'image_url': 'y.png'},
+              status=201),
+        _case('admin_bp.modify_meal', 'PUT', '/admin/meals/2', CATERER, {'price': 6}),
+        _case('admin_bp.setup_menu', 'POST', '/admin/menu', CATERER,
+              {'date': (today + timedelta(days=31)).strftime('%Y-%m-%d'), 'meal_ids': [2, 3]}, status=201),
+        _case('admin_bp.fetch_all_orders', 'GET', '/admin/orders', CATERER),
+        _case('admin_bp.view_earnings', 'GET', f'/admin/earnings?from={day}&to={week_end}', CATERER),
+        _case('admin_bp.view_earnings_breakdown', 'GET', f'/admin/earnings/meals?from={day}&to={week_end}', ADMIN),
+
+        _case('analytics_bp.top_meals', 'GET', f'/analytics/top-meals?from={day}&to={week_end}', ADMIN),
+        _case('analytics_bp.caterer_breakdown', 'GET', f'/analytics/caterers?from={day}&to={week_end}', ADMIN),
+        _case('analytics_bp.sales_series', 'GET', f'/analytics/series?from={day}&to={week_end}', ADMIN),
+
+        _case('user_bp.add_user', 'POST', '/users', body={'username': 'newbie', 'email': 'newbie@example.com', 'password': 'pw'},
+              status=201),
+        _case('user_bp.password_reset', 'POST', '/password-reset', body={'email': CUSTOMER}),
+        _case('user_bp.reset_password', 'POST', f'/reset-password/{reset_token}', body={'password': 'password'}),
+        _case('user_bp.update_user', 'PATCH', '/users/4', ADMIN, {'username': 'renamed'}),
+
+        # Destructive calls last
+        _case('admin_bp.delete_meal', 'DELETE', '/admin/meals/4', CATERER),
+        _case('meal.delete_meal', 'DELETE', '/meal/delete/5', ADMIN),
+        _case('user_bp.delete_user', 'DELETE', '/users/4', LEAVING_CUSTOMER),
+        _case('auth_bp.logout', 'DELETE', '/logout', CUSTOMER),
+    ]
+
+
+def build_app():
+    """The production blueprints and hooks on an isolated in-memory SQLite app."""
+    from Views.admin import admin_bp
+    from Views.analytics import analytics_bp
+    from Views.auth import auth_bp
+    from Views.meal import meal_bp
+    from Views.menu import menu_bp
+    from Views.notifications import notifications_bp
+    from Views.order import order_bp
+    from Views.user import user_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        JWT_SECRET_KEY='budget-secret-key-for-local-checks-only',
+        REVOCATION_REFRESH_SECONDS=10 ** 6,
+        SECRET_KEY='budget-secret',
+        MAIL_SUPPRESS_SEND=True,
+        MAIL_DEFAULT_SENDER='noreply@example.com',
+        SQL_SLOW_QUERY_MS=10 ** 6,
+    )
+    db.init_app(app)
+    mail.init_app(app)
+    JWTManager(app).token_in_blocklist_loader(revocation.is_revoked)
+    instrumentation.init_app(app)
+    for blueprint in (auth_bp, user_bp, meal_bp, menu_bp, order_bp, notifications_bp, analytics_bp, admin_bp):
+        app.register_blueprint(blueprint)
+    return app
+
+
+def seed(size, today):
+    """Users, meals, a week of menus, orders and notifications, all scaled by `size`."""
+    admin = User(email=ADMIN, username='admin', role='admin')
+    caterer = User(email=CATERER, username='caterer', role='caterer')
+    customers = [User(email=f'customer{i}@example.com', username=f'customer{i}', role='customer')
+                 for i in range(1, size + 1)]
+    for user in [admin, caterer] + customers:
+        user.set_password('password')
+    db.session.add_all([admin, caterer] + customers)
+    db.session.flush()
+
+    meals = [Meal(name=f'Meal {i}', price=float(i), caterer_id=(admin.id if i % 2 else caterer.id))
+             for i in range(1, size * 2 + 2)]
+    db.session.add_all(meals)
+    db.session.flush()
+
+    menus = []
+    for offset in range(7):
+        menu = Menu(date=today + timedelta(days=offset))
+        menu.meals.extend(meals)
+        menus.append(menu)
+    db.session.add_all(menus)
+    db.session.flush()
+
+    now = datetime.combine(today, datetime.min.time())
+    for customer in customers:
+        for i, meal in enumerate(meals):
+            db.session.add(Order(user_id=customer.id, menu_id=menus[i % 7].id, meal_id=meal.id,
+                                 date=now + timedelta(days=i % 7), quantity=1, total_price=meal.price,
+                                 created_at=now, updated_at=now,
+                                 intake_id=INTAKE_ID if customer is customers[0] and i == 0 else None))
+            db.session.add(Notification(user_id=customer.id, message=f'Notification {i}'))
+    db.session.commit()
+
+    rollups.backfill_revenue()
+    rollups.backfill_meal_stats()
+
+
+def measure(app, size):
+    """Run every case against a fresh database of the given size: {endpoint: (statements, status)}."""
+    today = date.today()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(size, today)
+        # Load the revocation list up front: its periodic refresh is not a per-request cost
+        revocation.clear()
+        revocation.refresh()
+        engine = db.engine
+
+    menu_cache.clear()
+    availability.clear()
+    search_index.clear()
+
+    counter = {'statements': 0}
+
+    def count(*args):
+        counter['statements'] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        results = {}
+        client = app.test_client()
+        for case in _cases(today):
+            headers = {}
+            if case.identity:
+                with app.app_context():
+                    make_token = create_refresh_token if case.refresh else create_access_token
+                    # Tokens as login issues them, with the uid and role claims
+                    user = auth_context.lookup(case.identity)
+                    claims = auth_context.token_claims(user) if user else {}
+                    headers['Authorization'] = f'Bearer {make_token(identity=case.identity, additional_claims=claims)}'
+
+            kwargs = {'headers': headers}
+            if isinstance(case.body, str):
+                kwargs.update(data=case.body, content_type=case.content_type)
+            elif case.body is not None:
+                kwargs['json'] = case.body
+
+            counter['statements'] = 0
+            response = client.open(case.path, method=case.method, **kwargs)
+            response.get_data()  # drain streamed bodies so their queries are counted
+            results[case.endpoint] = (counter['statements'], response.status_code)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return results
+
+
+@pytest.fixture(scope='module')
+def measured():
+    """{endpoint: ((small statements, status), (large statements, status))}, measured once."""
+    app = build_app()
+    small = measure(app, SMALL)
+    large = measure(app, LARGE)
+    return {endpoint: (small[endpoint], large[endpoint]) for endpoint in small}
+
+
+def test_every_case_has_a_budget(measured):
+    assert sorted(set(measured) - set(BUDGETS)) == [], 'cases without a budget'
+    assert sorted(set(BUDGETS) - set(measured)) == [], 'budgets without a case'
+
+
+@pytest.mark.parametrize('case', _cases(date.today()), ids=lambda case: case.endpoint)
+def test_endpoint_within_budget(measured, case):
+    budget = BUDGETS[case.endpoint]
+    (small_count, small_status), (large_count, large_status) = measured[case.endpoint]
+
+    assert (small_status, large_status) == (case.status, case.status), 'unexpected status'
+    assert large_count <= budget, f'{large_count} statements, budget is {budget}'
+    assert large_count <= small_count, \
+        f'statements grow with data ({small_count} at size {SMALL}, {large_count} at size {LARGE})'
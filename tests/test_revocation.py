@@ -0,0 +1,123 @@
+"""
+Token revocation: logged-out tokens are rejected on every worker, per-user revocations
+(role changes, deleted accounts) reject every earlier token and none issued after them,
+and revocations older than any live token are forgotten.
+
+Run with `python -m pytest`.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, decode_token
+
+from extensions import db
+from models import User, TokenBlocklist
+import auth_context
+import revocation
+
+ADMIN = 'admin@example.com'
+CUSTOMER = 'customer@example.com'
+
+
+@pytest.fixture
+def app():
+    from Views.auth import auth_bp
+    from Views.user import user_bp
+
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        JWT_SECRET_KEY='revocation-secret-key-for-local-checks-only',
+        JWT_ACCESS_TOKEN_EXPIRES=timedelta(hours=1),
+        JWT_REFRESH_TOKEN_EXPIRES=timedelta(days=30),
+        REVOCATION_REFRESH_SECONDS=10 ** 6,
+    )
+    db.init_app(app)
+    JWTManager(app).token_in_blocklist_loader(revocation.is_revoked)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(user_bp)
+
+    with app.app_context():
+        db.create_all()
+        for email, role in ((ADMIN, 'admin'), (CUSTOMER, 'customer')):
+            user = User(email=email, username=email.split('@')[0], role=role)
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+
+    auth_context.clear()
+    revocation.clear()
+    yield app
+    revocation.clear()
+
+
+def _login(client, email):
+    response = client.post('/login', json={'email': email, 'password': 'password'})
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def _customer_id(app):
+    with app.app_context():
+        return User.query.filter_by(email=CUSTOMER).one().id
+
+
+def test_role_change_revokes_earlier_tokens_only(app):
+    client = app.test_client()
+    admin = _login(client, ADMIN)
+    customer_id = _customer_id(app)
+
+    for role in ('caterer', 'customer', 'caterer'):
+        before = _login(client, CUSTOMER)
+        assert client.patch(f'/users/{customer_id}', json={'role': role}, headers=admin).status_code == 200
+        # Logging in again straight away, within the same second, gives a working token
+        after = _login(client, CUSTOMER)
+
+        assert client.get('/current_user', headers=before).status_code == 401
+        response = client.get('/current_user', headers=after)
+        assert response.status_code == 200
+        assert response.get_json()['role'] == role
+
+
+def test_logout_revokes_the_token_at_once(app):
+    client = app.test_client()
+    headers = _login(client, CUSTOMER)
+    assert client.get('/current_user', headers=headers).status_code == 200
+
+    assert client.delete('/logout', headers=headers).status_code == 200
+    assert client.get('/current_user', headers=headers).status_code == 401
+    # Other tokens of the same user are untouched
+    assert client.get('/current_user', headers=_login(client, CUSTOMER)).status_code == 200
+
+
+def test_logout_on_another_worker_is_seen_after_a_refresh(app):
+    client = app.test_client()
+    headers = _login(client, CUSTOMER)
+    assert client.get('/current_user', headers=headers).status_code == 200
+
+    # Another worker logged this token out: only the shared table knows
+    with app.app_context():
+        jti = decode_token(headers['Authorization'].split()[1])['jti']
+        db.session.add(TokenBlocklist(jti=jti, created_at=datetime.utcnow()))
+        db.session.commit()
+    assert client.get('/current_user', headers=headers).status_code == 200  # Until this worker refreshes
+
+    app.config['REVOCATION_REFRESH_SECONDS'] = 0
+    assert client.get('/current_user', headers=headers).status_code == 401
+
+
+def test_refresh_prunes_revocations_past_the_token_lifetime(app):
+    now = datetime.utcnow()
+    expired = now - timedelta(days=31)  # Older than the longest token lifetime
+    with app.app_context():
+        revocation.revoke('expired-jti', expired)
+        revocation.revoke('live-jti', now)
+        revocation.revoke_user(1, expired)
+        revocation.revoke_user(2, now)
+        revocation.refresh()
+
+        assert revocation.is_revoked({}, {'jti': 'live-jti'})
+    assert 'expired-jti' not in revocation._revoked
+    assert set(revocation._revoked_users) == {2}
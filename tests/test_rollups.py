@@ -0,0 +1,90 @@
+"""
+Revenue rollups: after orders are written and deleted, daily_revenue and
+meal_daily_stats must hold exactly what a rebuild from the orders table gives.
+
+Run with `python -m pytest`.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import select
+
+from extensions import db
+from models import User, Meal, Menu, Order, DailyRevenue, MealDailyStats
+import order_intake
+import rollups
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def _seed():
+    """Two caterers' meals, ordered by two customers over three days. Returns the users and meals."""
+    customers = [User(email=f'customer{i}@example.com', username=f'customer{i}', role='customer') for i in (1, 2)]
+    caterers = [User(email=f'caterer{i}@example.com', username=f'caterer{i}', role='caterer') for i in (1, 2)]
+    db.session.add_all(customers + caterers)
+    db.session.flush()
+
+    meals = [Meal(name=f'Meal {i}', price=float(i + 1), caterer_id=caterers[i % 2].id) for i in range(4)]
+    menu = Menu(date=date.today(), meals=meals)
+    db.session.add(menu)
+    db.session.flush()
+
+    today = datetime.combine(date.today(), datetime.min.time())
+    rows = []
+    for offset in range(3):
+        for customer in customers:
+            for quantity, meal in enumerate(meals, start=1):
+                rows.append({
+                    'user_id': customer.id, 'menu_id': menu.id, 'meal_id': meal.id, 'quantity': quantity,
+                    'total_price': meal.price * quantity, 'date': today + timedelta(days=offset),
+                    'status': 'pending', 'created_at': today, 'updated_at': today
+                })
+    order_intake.write_orders(rows)
+    db.session.commit()
+    return customers, caterers, meals
+
+
+def _rollups():
+    revenue = {row.day: (round(row.revenue, 2), row.order_count)
+               for row in DailyRevenue.query if row.order_count}
+    stats = {(row.day, row.meal_id): (row.quantity, round(row.revenue, 2), row.order_count)
+             for row in MealDailyStats.query if row.order_count}
+    return revenue, stats
+
+
+def _rebuilt():
+    rollups.backfill_revenue()
+    rollups.backfill_meal_stats()
+    return _rollups()
+
+
+def test_deleted_orders_leave_both_rollups(app):
+    customers, caterers, meals = _seed()
+    assert _rollups() == _rebuilt()
+    before = _rollups()
+
+    # A customer's orders, one meal's orders, then everything for a caterer's meals
+    rollups.delete_orders(Order.user_id == customers[0].id)
+    db.session.commit()
+    rollups.forget_meals([meals[0].id])
+    db.session.commit()
+    rollups.forget_meals(select(Meal.id).where(Meal.caterer_id == caterers[1].id))
+    db.session.commit()
+
+    incremental = _rollups()
+    assert incremental != before
+    assert incremental == _rebuilt()
+    assert not MealDailyStats.query.filter(MealDailyStats.meal_id.in_([meals[0].id, meals[1].id])).count()